@@ -6,19 +6,29 @@ Created on Fri Sep 12 12:54:57 2025
 @author: traedennord
 """
 
-from flask import Flask, redirect, request, session, url_for, render_template, flash, send_from_directory
+from flask import Flask, redirect, request, session, url_for, render_template, flash, send_file, jsonify, abort
 from flask_bootstrap import Bootstrap
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 import os
 import json
+import base64
+import logging
+import mimetypes
+import click
 from dotenv import load_dotenv
-import requests
-from datetime import datetime, timedelta
+from http_client import http_get, timing_summary
+from datetime import datetime, timedelta, timezone
 from urllib.parse import urlencode
-from sqlalchemy import func, or_, and_, text
+from sqlalchemy import func, tuple_
 # for switch to raw media file storage over urls
 from models_v2 import TimelineData 
-from media_downloader import MediaDownloader
+from media_downloader import MediaDownloader, DownloadPool
+from media_store import MediaIndex
+from fingerprints import DuplicateIndex, normalize_message
+from graph_comments import CommentFetcher
+from graph_sync import PostSync, GraphAPIError, GRAPH_PAGE_SIZE
+import jobs
 
 """from flask_sqlalchemy import SQLAlchemy
 import json
@@ -28,10 +38,17 @@ from sqlalchemy.dialects.postgresql import JSON
 
 
 # Import models and importer
-from models import db, Post, Comment
+from models import db, Post, Comment, Job, ImportCheckpoint, bulk_upsert, CacheVersionMixin, upgrade_schema
 from facebook_import import FacebookDataImporter
+from export_source import DirectorySource, ZipSource
+from log_config import configure_logging
+from timeline_cache import TimelineCache, cache_key
+from image_variants import ALTERNATE_FORMATS, alternate_path, backfill_variants, srcset
 
 load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 bootstrap = Bootstrap(app)
 
@@ -40,10 +57,33 @@ app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://localhost/timeline'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max
+app.config['TIMELINE_PAGE_SIZE'] = int(os.getenv('TIMELINE_PAGE_SIZE', 50))
+app.config['TIMELINE_MAX_PAGE_SIZE'] = 500
+app.config['IMPORT_BATCH_SIZE'] = int(os.getenv('IMPORT_BATCH_SIZE', 500))
+app.config['THUMBNAIL_WORKERS'] = int(os.getenv('THUMBNAIL_WORKERS', 0)) or None  # None = one per core
+app.config['IMPORT_WORKERS'] = int(os.getenv('IMPORT_WORKERS', 0)) or None  # post parsing processes; None = one per core, 1 = in-process
+app.config['IMPORT_STREAMING'] = os.getenv('IMPORT_STREAMING', 'true').lower() != 'false'  # read the zip in place
+app.config['GRAPH_API_ROOT'] = os.getenv('GRAPH_API_ROOT', 'https://graph.facebook.com')  # a stand-in server for testing
+app.config['DOWNLOAD_WORKERS'] = int(os.getenv('DOWNLOAD_WORKERS', 8))
+app.config['DOWNLOAD_PER_HOST'] = int(os.getenv('DOWNLOAD_PER_HOST', 4))
+app.config['TIMELINE_CACHE_SIZE'] = int(os.getenv('TIMELINE_CACHE_SIZE', 256))  # rendered pages; 0 disables
+app.config['MEDIA_MAX_AGE'] = int(os.getenv('MEDIA_MAX_AGE', 365 * 24 * 3600))
+app.config['MEDIA_SENDFILE'] = os.getenv('MEDIA_SENDFILE', '')  # '', 'nginx' (X-Accel-Redirect) or 'apache' (X-Sendfile)
+app.config['MEDIA_ACCEL_PREFIX'] = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-uploads/')  # nginx internal location
 
 # Initialize database with app
 db.init_app(app)
 
+# Older mimetypes tables lack the alternate image encodings
+mimetypes.add_type('image/webp', '.webp')
+mimetypes.add_type('image/avif', '.avif')
+
+# srcset attribute for a stored photo dict (see image_variants.py)
+app.add_template_filter(srcset, 'srcset')
+
+# Rendered /timeline-v2 pages, invalidated through TimelineData.cache_version()
+timeline_cache = TimelineCache(app.config['TIMELINE_CACHE_SIZE'])
+
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
@@ -55,6 +95,7 @@ REDIRECT_URI = 'http://localhost:5000/callback'
 def clear_imports():
     """Clear all imported posts to allow re-import"""
     count = Post.query.filter_by(source='import').delete()
+    ImportCheckpoint.query.delete()
     db.session.commit()
     flash(f'Cleared {count} imported posts', 'success')
     return redirect(url_for('import_data'))
@@ -160,38 +201,286 @@ def process_attachments(post_data):
     
     return photos, videos, links
 
+def graph_root():
+    """Base URL of the Graph API, without the version"""
+    return app.config['GRAPH_API_ROOT'].rstrip('/')
+
 def process_comments(post_id, access_token):
     """
-    Fetch and process comments for a specific post
+    Fetch all comments for a specific post (every page)
     """
-    comments_url = (
-        f'https://graph.facebook.com/v18.0/{post_id}/comments'
-        f'?access_token={access_token}'
-        f'&fields=id,message,created_time,from,like_count'
-        f'&limit=50'
-    )
-    
+    return CommentFetcher(access_token, graph_root()).fetch([post_id])[post_id]
+
+# Comment fields refreshed when a fetched comment is already stored
+COMMENT_UPDATE_COLUMNS = ('message', 'like_count')
+
+def comment_rows(post_id, comments):
+    """Comment table rows for process_comments results"""
+    return [{
+        'facebook_id': comment['id'],
+        'post_id': post_id,
+        'message': comment['message'],
+        'created_time': comment['created_time'],
+        'from_data': comment['from'],
+        'like_count': comment['like_count']
+    } for comment in comments]
+
+def upsert_comments(rows):
+    """Insert new comments and refresh stored ones in a single statement"""
+    if not rows:
+        return 0
+    db.session.flush()  # Posts added through the session must exist for the foreign key
+    return bulk_upsert(Comment, rows, COMMENT_UPDATE_COLUMNS)
+
+def encode_cursor(sort_value, row_id):
+    """Encode a (created_at or rank, id) keyset position as an opaque URL-safe token"""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, ranked=False):
+    """Decode a cursor from encode_cursor, returning None if missing or malformed"""
+    if not cursor:
+        return None
     try:
-        response = requests.get(comments_url)
-        comments_data = response.json()
-        
-        if 'data' in comments_data:
-            comments = []
-            for comment in comments_data['data']:
-                comments.append({
-                    'id': comment['id'],
-                    'message': comment.get('message', ''),
-                    'created_time': comment['created_time'],
-                    'from': comment.get('from', {}),
-                    'like_count': comment.get('like_count', 0)
-                })
-            return comments
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+        if ranked:
+            return float(sort_value), int(row_id)
+        if sort_value is None:
+            return None, int(row_id)  # Among the undated rows at the end
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+def parse_display_date(value, days=0):
+    """Parse a YYYY-MM-DD filter value as UTC midnight (shifted by days), or None"""
+    try:
+        day = datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+    return day + timedelta(days=days)
+
+def get_page_size():
+    """Read page_size from the request, clamped to the configured bounds"""
+    default_size = app.config['TIMELINE_PAGE_SIZE']
+    try:
+        page_size = int(request.args.get('page_size', default_size))
+    except ValueError:
+        page_size = default_size
+    return max(1, min(page_size, app.config['TIMELINE_MAX_PAGE_SIZE']))
+
+def apply_display_filters(query, model, args):
+    """Apply the display filters shared by both timelines as SQL predicates"""
+    if args.get('clear_filters') == 'true':
+        return query
+
+    display_start_date = args.get('display_start_date')
+    display_end_date = args.get('display_end_date')
+    min_length = args.get('min_length')
+    max_length = args.get('max_length')
+    has_tags = args.get('has_tags')
+
+    # Half-open range on the timestamptz column so the btree index applies
+    range_start = parse_display_date(display_start_date)
+    range_end = parse_display_date(display_end_date, days=1)
+    if range_start:
+        query = query.filter(model.created_at >= range_start)
+    if range_end:
+        query = query.filter(model.created_at < range_end)
+    if min_length:
+        try:
+            query = query.filter(func.length(model.message) >= int(min_length))
+        except ValueError:
+            pass
+    if max_length:
+        try:
+            query = query.filter(func.length(model.message) <= int(max_length))
+        except ValueError:
+            pass
+    if has_tags == 'yes':
+        query = query.filter(model.message.ilike('%@%'))
+    elif has_tags == 'no':
+        query = query.filter(~model.message.ilike('%@%'))
+
+    # Media filters use the maintained count columns, so LIMIT still applies
+    media_counts = {
+        'has_photo': model.photo_count,
+        'has_video': model.video_count,
+        'has_links': model.link_count,
+    }
+    for param, count_column in media_counts.items():
+        if args.get(param) == 'yes':
+            query = query.filter(count_column > 0)
+        elif args.get(param) == 'no':
+            query = query.filter(count_column == 0)
+
+    return query
+
+def apply_keyword_search(query, model, args):
+    """
+    Apply the keyword filter.
+
+    The default search_mode=fulltext matches stemmed words through the
+    search_vector GIN index and returns a rank expression; results are
+    ordered by it unless sort=newest. search_mode=substring keeps the old
+    ILIKE behaviour, served by the trigram index on message.
+
+    Returns:
+        (query, rank) where rank is None when results keep date order
+    """
+    keyword = args.get('keyword')
+    if args.get('clear_filters') == 'true' or not keyword:
+        return query, None
+
+    # Clean up keyword parameter
+    keyword = keyword.strip()
+    if keyword == '' or keyword.lower() == 'none':
+        return query, None
+
+    if args.get('search_mode') == 'substring':
+        return query.filter(model.message.ilike(f'%{keyword}%')), None
+
+    condition, rank = model.fulltext_match(keyword)
+    query = query.filter(condition)
+    if args.get('sort') == 'newest':
+        return query, None
+    return query, rank
+
+def paginate_timeline(query, model, cursor=None, page_size=50, rank=None):
+    """
+    Fetch one page of posts using keyset pagination on (created_at, id),
+    or on (rank, id) for relevance-ordered keyword searches.
+
+    Each page seeks past the last row of the previous page instead of using
+    OFFSET, so page N costs the same as page 1 regardless of archive size.
+
+    Args:
+        query: Filtered query over model (ordering is applied here)
+        model: Post or TimelineData
+        cursor: Token from a previous page's next_cursor, or None for page 1
+        page_size: Number of posts to return
+        rank: Optional relevance expression to order by instead of date
+
+    Returns:
+        (posts, next_cursor) where next_cursor is None on the last page
+    """
+    sort_key = model.created_at if rank is None else rank
+    # Posts without a parseable created_time (NULL created_at) come last
+    query = query.order_by(sort_key.desc().nullslast(), model.id.desc())
+    if rank is not None:
+        query = query.add_columns(rank.label('rank'))
+
+    position = decode_cursor(cursor, ranked=rank is not None)
+    if not position:
+        rows = query.limit(page_size + 1).all()
+    else:
+        sort_value, row_id = position
+        if sort_value is None:
+            rows = query.filter(sort_key.is_(None), model.id < row_id).limit(page_size + 1).all()
         else:
-            print(f"No comments found for post {post_id}")
-            return []
-    except Exception as e:
-        print(f"Error fetching comments for post {post_id}: {e}")
-        return []
+            # A row-value comparison is a single btree index condition, unlike
+            # the equivalent OR; it leaves out NULL sort keys, which follow
+            # every dated row and are fetched only once the dated rows run out
+            rows = query.filter(tuple_(sort_key, model.id) < tuple_(sort_value, row_id)) \
+                .limit(page_size + 1).all()
+            if len(rows) <= page_size and rank is None:
+                rows += query.filter(sort_key.is_(None)).limit(page_size + 1 - len(rows)).all()
+
+    # One extra row tells us whether another page exists
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if rank is None:
+        posts = rows
+        last_sort_value = posts[-1].created_at if posts else None
+    else:
+        posts = [post for post, _ in rows]
+        last_sort_value = rows[-1][1] if rows else None
+
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(last_sort_value, posts[-1].id)
+    return posts, next_cursor
+
+def timeline_post_data(posts):
+    """Build the media and comment lookups the timeline lightbox reads from JS"""
+    media = {}
+    comments = {}
+
+    for post in posts:
+        combined_media = []
+        for index, photo in enumerate(post.photos or [], start=1):
+            combined_media.append({
+                'type': 'photo',
+                'src': photo.get('src'),
+                'alt': f'Photo {index}'
+            })
+        for index, video in enumerate(post.videos or [], start=1):
+            combined_media.append({
+                'type': 'video',
+                'src': video.get('src') or None,
+                'thumbnail': video.get('thumbnail') or None,
+                'url': video.get('url') or None,
+                'title': video.get('title') or None,
+                'alt': f'Video {index}'
+            })
+        if combined_media:
+            media[post.facebook_id] = combined_media
+        if post.comments:
+            comments[post.facebook_id] = post.comments
+
+    return {'media': media, 'comments': comments}
+
+def next_page_url(endpoint, next_cursor):
+    """Build the JSON next-page URL, carrying the current display filters forward"""
+    if not next_cursor:
+        return None
+    params = {
+        key: value for key, value in request.args.items()
+        if key not in ('cursor', 'fetch_api', 'fetch_comments')
+    }
+    params['cursor'] = next_cursor
+    return url_for(endpoint, **params)
+
+def fetch_timeline_page(model):
+    """Fetch the page of model rows selected by the current request's filters and cursor"""
+    query = apply_display_filters(model.query, model, request.args)
+    query, rank = apply_keyword_search(query, model, request.args)
+    return paginate_timeline(
+        query, model,
+        cursor=request.args.get('cursor'),
+        page_size=get_page_size(),
+        rank=rank
+    )
+
+def timeline_page_json(model, endpoint):
+    """Return one timeline page as rendered cards plus lightbox data"""
+    user_data = session.get('user_data', {'name': 'User', 'id': 'unknown'})
+    
+    # Pages of versioned tables are served from the cache until the table changes
+    cacheable = issubclass(model, CacheVersionMixin)
+    if cacheable:
+        key = cache_key(endpoint, request.args, user_data)
+        version = model.cache_version()
+        cached = timeline_cache.get(key, version)
+        if cached is not None:
+            return jsonify(cached)
+    
+    posts, next_cursor = fetch_timeline_page(model)
+    post_data = timeline_post_data(posts)
+    page = {
+        'html': render_template('_timeline_posts.html', posts=posts, user_data=user_data),
+        'media': post_data['media'],
+        'comments': post_data['comments'],
+        'count': len(posts),
+        'next_cursor': next_cursor,
+        'next_page_url': next_page_url(endpoint, next_cursor)
+    }
+    if cacheable:
+        timeline_cache.put(key, version, page)
+    return jsonify(page)
 
 @app.route('/')
 def home():
@@ -264,14 +553,14 @@ def callback():
     
     # Token exchange
     token_url = (
-        f'https://graph.facebook.com/v18.0/oauth/access_token'
+        f'{graph_root()}/v18.0/oauth/access_token'
         f'?client_id={FB_APP_ID}'
         f'&redirect_uri={original_redirect_uri}'
         f'&client_secret={FB_APP_SECRET}'
         f'&code={code}'
     )
     
-    response = requests.get(token_url)
+    response = http_get(token_url)
     data = response.json()
     
     access_token = data.get('access_token')
@@ -303,6 +592,129 @@ def callback():
         
         return redirect(redirect_url)
 
+def store_api_posts(posts, access_token, fetch_comments=None):
+    """
+    Save one page of /me/posts results to the Post table (v1, linked media)
+
+    Returns:
+        True if every new post was stored
+    """
+    logger.info("Processing %d posts from API", len(posts))
+    stored = True
+    existing_ids = {facebook_id for (facebook_id,) in Post.query
+                    .with_entities(Post.facebook_id)
+                    .filter(Post.facebook_id.in_([post['id'] for post in posts]))}
+    
+    # Comments for every new post on the page, in a few batched Graph API calls
+    comments_by_post = {}
+    if fetch_comments == 'yes':
+        new_ids = [post['id'] for post in posts if post['id'] not in existing_ids]
+        comments_by_post = CommentFetcher(access_token, graph_root()).fetch(new_ids)
+    
+    pending_comments = []
+    for post in posts:
+        if post['id'] not in existing_ids:
+            try:
+                photos, videos, links = process_attachments(post)
+                from_data = post.get('from')
+                comments = comments_by_post.get(post['id'], [])
+                
+                new_post = Post(
+                    facebook_id=post['id'],
+                    message=post.get('message', ''),
+                    created_time=post['created_time'],
+                    photos=photos if photos else None,
+                    videos=videos if videos else None,
+                    links=links if links else None,
+                    from_data=from_data,
+                    comments=comments if comments else None
+                )
+                db.session.add(new_post)
+                existing_ids.add(post['id'])  # The page may repeat a post
+                logger.debug("Added post %s", post['id'])
+                
+                # Individual comments go to the Comment table in one upsert for the page
+                pending_comments.extend(comment_rows(post['id'], comments))
+                
+            except Exception:
+                logger.exception("Error processing post %s", post['id'])
+                stored = False
+        else:
+            logger.debug("Post %s already exists, skipping", post['id'])
+    
+    try:
+        upsert_comments(pending_comments)
+        db.session.commit()
+        logger.debug("Database commit completed successfully")
+    except Exception as e:
+        logger.error("Database commit failed: %s", e)
+        db.session.rollback()
+        return False
+    return stored
+
+def sync_timeline(access_token, user_id, api_filters, fetch_comments=None, progress=None):
+    """
+    Fetch /me/posts into the Post table (runs in a worker)
+
+    Returns:
+        dict with pages fetched and posts seen
+    """
+    api_start_date = api_filters.get('start_date')
+    api_end_date = api_filters.get('end_date')
+    api_post_type = api_filters.get('post_type')
+    
+    # Convert dates to Unix timestamps for Facebook API
+    since_param = ''
+    until_param = ''
+    if api_start_date:
+        try:
+            start_timestamp = int(datetime.strptime(api_start_date, '%Y-%m-%d').timestamp())
+            since_param = f'&since={start_timestamp}'
+        except ValueError:
+            pass
+    if api_end_date:
+        try:
+            end_datetime = datetime.strptime(api_end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+            end_timestamp = int(end_datetime.timestamp())
+            until_param = f'&until={end_timestamp}'
+        except ValueError:
+            pass
+    
+    type_param = f'&type={api_post_type}' if api_post_type else ''
+    
+    # Unfiltered fetches are incremental: only posts newer than the last full sync
+    sync = PostSync(user_id, 'post', incremental=not (api_start_date or api_end_date or api_post_type))
+    if sync.since:
+        since_param = f'&since={sync.since}'
+    
+    posts_url = (
+        f'{graph_root()}/v18.0/me/posts'  # Changed from feed to posts for your own posts
+        f'?access_token={access_token}'
+        f'&fields=id,message,created_time,link,from,attachments{{type,media_type,media,url,title,description,subattachments{{type,media_type,media,url,title,description}},target{{url}}}}'
+        f'{since_param}{until_param}{type_param}&limit={GRAPH_PAGE_SIZE}'
+    )
+    
+    logger.debug("Facebook API URL: %s", posts_url.replace(access_token, '***'))
+    
+    counts = {'pages': 0, 'posts_seen': 0}
+    
+    # Store posts in database, one Graph API page at a time
+    for page in sync.pages(posts_url):
+        if not store_api_posts(page, access_token, fetch_comments):
+            sync.store_failed()
+        counts['pages'] += 1
+        counts['posts_seen'] += len(page)
+        if progress:
+            progress(dict(counts))
+    sync.finish()
+    
+    return counts
+
+@jobs.handler('sync_timeline')
+def sync_timeline_job(payload, progress):
+    return sync_timeline(payload['access_token'], payload.get('user_id'), payload.get('api_filters', {}),
+                         payload.get('fetch_comments'), progress)
+
 @app.route('/timeline')
 def timeline():
     if 'access_token' not in session:
@@ -311,11 +723,11 @@ def timeline():
     
     # Fetch user data
     graph_url = (
-        f'https://graph.facebook.com/v18.0/me'
+        f'{graph_root()}/v18.0/me'
         f'?access_token={access_token}'
         f'&fields=id,name'
     )
-    response = requests.get(graph_url)
+    response = http_get(graph_url)
     data = response.json()
     if 'error' in data:
         return f"Error fetching user data: {data['error']['message']}", 500
@@ -326,23 +738,9 @@ def timeline():
     api_end_date = request.args.get('api_end_date')
     api_post_type = request.args.get('api_post_type')
     
-    # Get display filters from request
-    display_start_date = request.args.get('display_start_date')
-    display_end_date = request.args.get('display_end_date')
-    keyword = request.args.get('keyword')
-    has_photo = request.args.get('has_photo')
-    has_video = request.args.get('has_video')
-    has_links = request.args.get('has_links')
-    min_length = request.args.get('min_length')
-    max_length = request.args.get('max_length')
-    has_tags = request.args.get('has_tags')
-    clear_filters = request.args.get('clear_filters')
+    # Display filters are applied by fetch_timeline_page
     fetch_comments = request.args.get('fetch_comments')  # New parameter
     
-    # Clean up keyword parameter
-    if keyword and (keyword.strip() == '' or keyword.lower() == 'none'):
-        keyword = None
-    
     # Set defaults and validate API filters
     if api_start_date or api_end_date or api_post_type:
         if not api_start_date:
@@ -356,528 +754,364 @@ def timeline():
         except ValueError:
             return "Invalid API date format. Please ensure dates are in YYYY-MM-DD format.", 400
     
-    # Fetch posts from API
-    if True:  # Always fetch posts
-        # Convert dates to Unix timestamps for Facebook API
-        since_param = ''
-        until_param = ''
-        if api_start_date:
-            try:
-                start_timestamp = int(datetime.strptime(api_start_date, '%Y-%m-%d').timestamp())
-                since_param = f'&since={start_timestamp}'
-            except ValueError:
-                pass
-        if api_end_date:
-            try:
-                end_datetime = datetime.strptime(api_end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-                end_timestamp = int(end_datetime.timestamp())
-                until_param = f'&until={end_timestamp}'
-            except ValueError:
-                pass
-        
-        type_param = f'&type={api_post_type}' if api_post_type else ''
-        limit = '100' if (api_start_date or api_end_date or api_post_type) else '20'
-        
-        posts_url = (
-            f'https://graph.facebook.com/v18.0/me/posts'  # Changed from feed to posts for your own posts
-            f'?access_token={access_token}'
-            f'&fields=id,message,created_time,link,from,attachments{{type,media_type,media,url,title,description,subattachments{{type,media_type,media,url,title,description}},target{{url}}}}'
-            f'{since_param}{until_param}{type_param}&limit={limit}'
-        )
-        
-        print(f"Facebook API URL: {posts_url}")
-        
-        posts_response = requests.get(posts_url)
-        posts_data = posts_response.json()
-        
-        if 'error' in posts_data:
-            return render_template('error.html', message=f"Error fetching posts: {posts_data['error']['message']}"), 500
-        
-        # Store posts in database
-        with app.app_context():
-            print(f"Processing {len(posts_data.get('data', []))} posts from API")
-            for post in posts_data.get('data', []):
-                existing_post = Post.query.filter_by(facebook_id=post['id']).first()
-                if not existing_post:
-                    try:
-                        photos, videos, links = process_attachments(post)
-                        from_data = post.get('from')
-                        
-                        # Fetch comments if requested
-                        comments = []
-                        if fetch_comments == 'yes':
-                            comments = process_comments(post['id'], access_token)
-                        
-                        new_post = Post(
-                            facebook_id=post['id'],
-                            message=post.get('message', ''),
-                            created_time=post['created_time'],
-                            photos=photos if photos else None,
-                            videos=videos if videos else None,
-                            links=links if links else None,
-                            from_data=from_data,
-                            comments=comments if comments else None
-                        )
-                        db.session.add(new_post)
-                        print(f"  Successfully added post {post['id']}")
-                        
-                        # Store individual comments in Comment table
-                        if comments:
-                            for comment in comments:
-                                existing_comment = Comment.query.filter_by(facebook_id=comment['id']).first()
-                                if not existing_comment:
-                                    new_comment = Comment(
-                                        facebook_id=comment['id'],
-                                        post_id=post['id'],
-                                        message=comment['message'],
-                                        created_time=comment['created_time'],
-                                        from_data=comment['from'],
-                                        like_count=comment['like_count']
-                                    )
-                                    db.session.add(new_comment)
-                        
-                    except Exception as e:
-                        print(f"  ERROR processing post {post['id']}: {e}")
-                else:
-                    print(f"Post {post['id']} already exists, skipping")
-            
-            try:
-                db.session.commit()
-                print("Database commit completed successfully")
-            except Exception as e:
-                print(f"Database commit failed: {e}")
-                db.session.rollback()
-    
-    # Server-side filtering for display (same as before)
-    query = Post.query.order_by(Post.created_time.desc())
-    
-    if clear_filters != 'true':
-        if display_start_date:
-            query = query.filter(func.substring(Post.created_time, 1, 10) >= display_start_date)
-        if display_end_date:
-            query = query.filter(func.substring(Post.created_time, 1, 10) <= display_end_date)
-        if keyword:
-            query = query.filter(Post.message.ilike(f'%{keyword}%'))
-        if min_length:
-            try:
-                query = query.filter(func.length(Post.message) >= int(min_length))
-            except ValueError:
-                pass
-        if max_length:
-            try:
-                query = query.filter(func.length(Post.message) <= int(max_length))
-            except ValueError:
-                pass
-        if has_tags == 'yes':
-            query = query.filter(Post.message.ilike('%@%'))
-        elif has_tags == 'no':
-            query = query.filter(~Post.message.ilike('%@%'))
-    
-    all_posts = query.all()
-    
-    # Apply JSON-based filters
-    filtered_posts = []
-    for post in all_posts:
-        if clear_filters == 'true':
-            filtered_posts.append(post)
+    # API fetches run in a background worker; the page polls the job and reloads with synced=1
+    job = None
+    if not request.args.get('synced'):
+        try:
+            job = jobs.enqueue_unique('sync_timeline', {
+                'access_token': access_token,
+                'user_id': user_data.get('id'),
+                'api_filters': {'start_date': api_start_date, 'end_date': api_end_date,
+                                'post_type': api_post_type},
+                'fetch_comments': fetch_comments
+            }, key='user_id')
+        except Exception as e:
+            logger.error("Could not queue API fetch: %s", e)
+    
+    # Server-side filtering for display, one keyset page at a time
+    session['user_data'] = user_data
+    posts, next_cursor = fetch_timeline_page(Post)
+    
+    return render_template(
+        'timeline.html',
+        posts=posts,
+        user_data=user_data,
+        post_data=timeline_post_data(posts),
+        next_page_url=next_page_url('timeline_page', next_cursor),
+        job=job.to_dict() if job else None,
+        job_done_url=url_for('timeline', **{**request.args.to_dict(), 'synced': '1'})
+    )
+
+@app.route('/timeline/page')
+def timeline_page():
+    """JSON next-page endpoint for infinite scroll on /timeline"""
+    if 'access_token' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    return timeline_page_json(Post, 'timeline_page')
+
+
+def store_api_posts_v2(posts, downloads, media_quality, duplicates):
+    """
+    Save one page of /me/posts results to TimelineData, downloading media
+
+    Every new post's downloads are queued before any are collected, so
+    media downloads overlap across the whole page.
+
+    Returns:
+        True if every new, non-duplicate post was stored
+    """
+    logger.info("Processing %d posts from API", len(posts))
+    stored = True
+    
+    # Start every new post's downloads first so they run concurrently across posts
+    queued = []
+    for post in posts:
+        # Check by Facebook ID first
+        existing_post = TimelineData.query.filter_by(facebook_id=post['id']).first()
+        if existing_post:
+            logger.debug("Post %s already exists (by ID), skipping", post['id'])
             continue
-        
-        if has_photo == 'yes':
-            if not post.photos or not isinstance(post.photos, list) or len(post.photos) == 0:
-                continue
-        elif has_photo == 'no':
-            if post.photos and isinstance(post.photos, list) and len(post.photos) > 0:
-                continue
-        
-        if has_video == 'yes':
-            if not post.videos or not isinstance(post.videos, list) or len(post.videos) == 0:
-                continue
-        elif has_video == 'no':
-            if post.videos and isinstance(post.videos, list) and len(post.videos) > 0:
-                continue
-        
-        if has_links == 'yes':
-            if not post.links or not isinstance(post.links, list) or len(post.links) == 0:
-                continue
-        elif has_links == 'no':
-            if post.links and isinstance(post.links, list) and len(post.links) > 0:
+
+        try:
+            queued.append((post, queue_attachment_downloads(
+                post, downloads, post['created_time'], media_quality
+            )))
+        except Exception:
+            logger.exception("Error queueing media for post %s", post['id'])
+            stored = False
+
+    for post, pending_media in queued:
+        try:
+            # Extract message and media BEFORE checking for content duplicates
+            message = post.get('message', '')
+
+            # Wait for this post's attachments to get media counts
+            photos_temp, videos_temp, links_temp = collect_attachment_downloads(pending_media)
+
+            photo_count = len(photos_temp) if photos_temp else 0
+            video_count = len(videos_temp) if videos_temp else 0
+
+            # Check for content-based duplicates (same message + media counts)
+            created_time = post['created_time']
+            if duplicates.contains(message, photo_count, video_count, created_time):
+                logger.debug("Duplicate post %s (content match): %.50s... photos=%d videos=%d time=%s",
+                             post['id'], normalize_message(message), photo_count, video_count, created_time)
                 continue
-        
-        filtered_posts.append(post)
+            duplicates.add(message, photo_count, video_count, created_time)
+
+            # Not a duplicate - add to database
+            new_post = TimelineData(
+                facebook_id=post['id'],
+                message=message,
+                created_time=created_time,
+                photos=photos_temp if photos_temp else None,
+                videos=videos_temp if videos_temp else None,
+                links=links_temp if links_temp else None,
+                from_data=post.get('from'),
+                source='api_v2',
+                media_quality=media_quality
+            )
+            db.session.add(new_post)
+            logger.debug("Added post %s with downloaded media", post['id'])
+
+        except Exception:
+            logger.exception("Error processing post %s", post['id'])
+            stored = False
     
-    return render_template('timeline.html', posts=filtered_posts, user_data=user_data)
+    try:
+        db.session.commit()
+        logger.debug("Database commit completed successfully")
+    except Exception as e:
+        logger.error("Database commit failed: %s", e)
+        db.session.rollback()
+        return False
+    return stored
 
+def sync_timeline_v2(access_token, api_filters, progress=None):
+    """
+    Fetch /me/posts into TimelineData, downloading media (runs in a worker)
+
+    Returns:
+        dict with pages fetched and posts seen
+    """
+    media_quality = api_filters.get('media_quality', 'high')
+    
+    # Initialize media downloader; the index lets re-syncs skip media already stored
+    downloader = MediaDownloader(index=MediaIndex(db.engine))
+    
+    # Fetch user data
+    graph_url = (
+        f'{graph_root()}/v18.0/me'
+        f'?access_token={access_token}'
+        f'&fields=id,name'
+    )
+    response = http_get(graph_url)
+    data = response.json()
+    if 'error' in data:
+        raise GraphAPIError(data['error'].get('message', 'Unknown Graph API error'))
+    
+    # Get API filters
+    api_start_date = api_filters.get('start_date')
+    api_end_date = api_filters.get('end_date')
+    api_post_type = api_filters.get('post_type')
+    
+    # Convert dates to Unix timestamps for Facebook API
+    since_param = ''
+    until_param = ''
+    if api_start_date:
+        try:
+            start_timestamp = int(datetime.strptime(api_start_date, '%Y-%m-%d').timestamp())
+            since_param = f'&since={start_timestamp}'
+        except ValueError:
+            pass
+    if api_end_date:
+        try:
+            end_datetime = datetime.strptime(api_end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+            end_timestamp = int(end_datetime.timestamp())
+            until_param = f'&until={end_timestamp}'
+        except ValueError:
+            pass
+    
+    type_param = f'&type={api_post_type}' if api_post_type else ''
+    
+    # Unfiltered fetches are incremental: only posts newer than the last full sync
+    sync = PostSync(data.get('id'), 'timeline_data',
+                    incremental=not (api_start_date or api_end_date or api_post_type))
+    if sync.since:
+        since_param = f'&since={sync.since}'
+    
+    # Fetch posts from API
+    posts_url = (
+        f'{graph_root()}/v18.0/me/posts'
+        f'?access_token={access_token}'
+        f'&fields=id,message,created_time,link,from,'
+        f'attachments{{type,media_type,media,url,title,description,'
+        f'subattachments.limit(100){{type,media_type,media,url,title,description}},'
+        f'target{{url}}}}'
+        f'{since_param}{until_param}{type_param}&limit={GRAPH_PAGE_SIZE}'
+    )    
+    
+    logger.debug("Facebook API URL: %s", posts_url.replace(access_token, '***'))
+    
+    counts = {'pages': 0, 'posts_seen': 0}
+    
+    # Process posts with media downloading, one Graph API page at a time
+    with DownloadPool(
+        downloader,
+        max_workers=app.config['DOWNLOAD_WORKERS'],
+        per_host=app.config['DOWNLOAD_PER_HOST']
+    ) as downloads:
+        # Fingerprint lookups hit the index; posts added this sync are tracked in memory
+        duplicates = DuplicateIndex(TimelineData, preload=False)
+        for page in sync.pages(posts_url):
+            if not store_api_posts_v2(page, downloads, media_quality, duplicates):
+                sync.store_failed()
+            counts['pages'] += 1
+            counts['posts_seen'] += len(page)
+            if progress:
+                progress(dict(counts))
+        sync.finish()
+        logger.info("API fetch: %s", timing_summary())
+    
+    return counts
+
+@jobs.handler('sync_timeline_v2')
+def sync_timeline_v2_job(payload, progress):
+    return sync_timeline_v2(payload['access_token'], payload.get('api_filters', {}), progress)
 
 @app.route('/timeline-v2')
 def timeline_v2():
     # Initialize default values
     user_data = {'name': 'User', 'id': 'unknown'}
     fetch_from_api = request.args.get('fetch_api') == 'true'
+    job = None
     
-    # Only do API operations if we have an access token AND fetch_api flag is set
-    if 'access_token' in session and fetch_from_api:
-        try:
-            access_token = session['access_token']
-            api_filters = session.get('api_filters', {})
-            media_quality = api_filters.get('media_quality', 'high')
-            
-            # Initialize media downloader
-            downloader = MediaDownloader()
-            
-            # Fetch user data
-            graph_url = (
-                f'https://graph.facebook.com/v18.0/me'
-                f'?access_token={access_token}'
-                f'&fields=id,name'
-            )
-            response = requests.get(graph_url)
-            data = response.json()
-            if 'error' not in data:
-                user_data = data
-            
-            # Get API filters
-            api_start_date = api_filters.get('start_date')
-            api_end_date = api_filters.get('end_date')
-            api_post_type = api_filters.get('post_type')
-            
-            # Convert dates to Unix timestamps for Facebook API
-            since_param = ''
-            until_param = ''
-            if api_start_date:
-                try:
-                    start_timestamp = int(datetime.strptime(api_start_date, '%Y-%m-%d').timestamp())
-                    since_param = f'&since={start_timestamp}'
-                except ValueError:
-                    pass
-            if api_end_date:
-                try:
-                    end_datetime = datetime.strptime(api_end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-                    end_timestamp = int(end_datetime.timestamp())
-                    until_param = f'&until={end_timestamp}'
-                except ValueError:
-                    pass
-            
-            type_param = f'&type={api_post_type}' if api_post_type else ''
-            limit = '100' if (api_start_date or api_end_date or api_post_type) else '20'
-            
-            # Fetch posts from API
-            posts_url = (
-                f'https://graph.facebook.com/v18.0/me/posts'
-                f'?access_token={access_token}'
-                f'&fields=id,message,created_time,link,from,'
-                f'attachments{{type,media_type,media,url,title,description,'
-                f'subattachments.limit(100){{type,media_type,media,url,title,description}},'
-                f'target{{url}}}}'
-                f'{since_param}{until_param}{type_param}&limit={limit}'
-            )    
-            
-            print(f"Facebook API URL: {posts_url}")
-            
-            posts_response = requests.get(posts_url)
-            posts_data = posts_response.json()
-            
-            if 'error' not in posts_data:
-                # Process posts with media downloading
-                with app.app_context():
-                    print(f"Processing {len(posts_data.get('data', []))} posts from API")
-                    for post in posts_data.get('data', []):
-                        # Check by Facebook ID first
-                        existing_post = TimelineData.query.filter_by(facebook_id=post['id']).first()
-                        if existing_post:
-                            print(f"Post {post['id']} already exists (by ID), skipping")
-                            continue
-                        
-                        try:
-                            # Extract message and media BEFORE checking for content duplicates
-                            message = post.get('message', '')
-                            
-                            # Process attachments first to get media counts
-                            photos_temp, videos_temp, links_temp = process_attachments_v2(
-                                post, downloader, post['created_time'], media_quality
-                            )
-                            
-                            photo_count = len(photos_temp) if photos_temp else 0
-                            video_count = len(videos_temp) if videos_temp else 0
-                            
-                            # Normalize message for comparison
-                            normalized_message = ' '.join(message.strip().split()) if message else ""
-                            
-                            # Check for content-based duplicates (same message + media counts)
-                            created_time = post['created_time']
-                            date_obj = datetime.strptime(created_time[:10], '%Y-%m-%d')
-                            date_before = (date_obj - timedelta(days=1)).strftime('%Y-%m-%d')
-                            date_after = (date_obj + timedelta(days=1)).strftime('%Y-%m-%d')
-                            
-                            existing_posts = TimelineData.query.filter(
-                                and_(
-                                    TimelineData.created_time >= f"{date_before}T00:00:00",
-                                    TimelineData.created_time <= f"{date_after}T23:59:59"
-                                )
-                            ).all()
-                            
-                            # Check for matching fingerprint
-                            is_duplicate = False
-                            for existing in existing_posts:
-                                existing_photo_count = len(existing.photos) if existing.photos else 0
-                                existing_video_count = len(existing.videos) if existing.videos else 0
-                                existing_message = ' '.join(existing.message.strip().split()) if existing.message else ""
-                                
-                                if (normalized_message == existing_message and 
-                                    photo_count == existing_photo_count and 
-                                    video_count == existing_video_count):
-                                    
-                                    print(f"  🔍 Duplicate detected (content match):")
-                                    print(f"     Message: {normalized_message[:50]}...")
-                                    print(f"     Photos: {photo_count}, Videos: {video_count}")
-                                    print(f"     API time: {created_time}")
-                                    print(f"     Existing time: {existing.created_time}")
-                                    is_duplicate = True
-                                    break
-                            
-                            if is_duplicate:
-                                continue
-                            
-                            # Not a duplicate - add to database
-                            new_post = TimelineData(
-                                facebook_id=post['id'],
-                                message=message,
-                                created_time=created_time,
-                                photos=photos_temp if photos_temp else None,
-                                videos=videos_temp if videos_temp else None,
-                                links=links_temp if links_temp else None,
-                                from_data=post.get('from'),
-                                source='api_v2',
-                                media_quality=media_quality
-                            )
-                            db.session.add(new_post)
-                            print(f"  ✅ Successfully added post {post['id']} with downloaded media")
-                            
-                        except Exception as e:
-                            print(f"  ERROR processing post {post['id']}: {e}")
-                    
-                    try:
-                        db.session.commit()
-                        print("Database commit completed successfully")
-                    except Exception as e:
-                        print(f"Database commit failed: {e}")
-                        db.session.rollback()        
-        except Exception as e:
-            print(f"API fetch error: {e}")
-            # Continue anyway to show existing posts
-    
-    elif 'access_token' in session:
-        # We have access token but not fetching - just get user data
-        try:
-            access_token = session['access_token']
-            graph_url = (
-                f'https://graph.facebook.com/v18.0/me'
-                f'?access_token={access_token}'
-                f'&fields=id,name'
-            )
-            response = requests.get(graph_url)
-            data = response.json()
-            if 'error' not in data:
-                user_data = data
-        except Exception as e:
-            print(f"Could not fetch user data: {e}")
-    
-    # ALWAYS query and filter posts from database (works with or without API)
-    query = TimelineData.query.order_by(TimelineData.created_time.desc())
-    
-    # Apply display filters
-    display_start_date = request.args.get('display_start_date')
-    display_end_date = request.args.get('display_end_date')
-    keyword = request.args.get('keyword')
-    has_photo = request.args.get('has_photo')
-    has_video = request.args.get('has_video')
-    has_links = request.args.get('has_links')
-    min_length = request.args.get('min_length')
-    max_length = request.args.get('max_length')
-    has_tags = request.args.get('has_tags')
-    clear_filters = request.args.get('clear_filters')
-    
-    if clear_filters != 'true':
-        if display_start_date:
-            query = query.filter(func.substring(TimelineData.created_time, 1, 10) >= display_start_date)
-        if display_end_date:
-            query = query.filter(func.substring(TimelineData.created_time, 1, 10) <= display_end_date)
-        if keyword:
-            query = query.filter(TimelineData.message.ilike(f'%{keyword}%'))
-        if min_length:
-            try:
-                query = query.filter(func.length(TimelineData.message) >= int(min_length))
-            except ValueError:
-                pass
-        if max_length:
-            try:
-                query = query.filter(func.length(TimelineData.message) <= int(max_length))
-            except ValueError:
-                pass
-        if has_tags == 'yes':
-            query = query.filter(TimelineData.message.ilike('%@%'))
-        elif has_tags == 'no':
-            query = query.filter(~TimelineData.message.ilike('%@%'))
-    
-    all_posts = query.all()
-    
-    # Apply JSON-based filters
-    filtered_posts = []
-    for post in all_posts:
-        if clear_filters == 'true':
-            filtered_posts.append(post)
-            continue
-        
-        if has_photo == 'yes':
-            if not post.photos or not isinstance(post.photos, list) or len(post.photos) == 0:
-                continue
-        elif has_photo == 'no':
-            if post.photos and isinstance(post.photos, list) and len(post.photos) > 0:
-                continue
-        
-        if has_video == 'yes':
-            if not post.videos or not isinstance(post.videos, list) or len(post.videos) == 0:
-                continue
-        elif has_video == 'no':
-            if post.videos and isinstance(post.videos, list) and len(post.videos) > 0:
-                continue
+    if 'access_token' in session:
+        access_token = session['access_token']
         
-        if has_links == 'yes':
-            if not post.links or not isinstance(post.links, list) or len(post.links) == 0:
-                continue
-        elif has_links == 'no':
-            if post.links and isinstance(post.links, list) and len(post.links) > 0:
-                continue
+        # Just get user data for the header, once per login
+        known_user = session.get('user_data', {})
+        if known_user.get('id', 'unknown') != 'unknown' and not fetch_from_api:
+            user_data = known_user
+        else:
+            try:
+                graph_url = (
+                    f'{graph_root()}/v18.0/me'
+                    f'?access_token={access_token}'
+                    f'&fields=id,name'
+                )
+                response = http_get(graph_url)
+                data = response.json()
+                if 'error' not in data:
+                    user_data = data
+            except Exception as e:
+                logger.warning("Could not fetch user data: %s", e)
         
-        filtered_posts.append(post)
+        # API fetches run in a background worker; the page polls the job.
+        # Reloads while a sync for this user is queued or running reuse it
+        if fetch_from_api:
+            payload = {
+                'access_token': access_token,
+                'user_id': user_data['id'],
+                'api_filters': session.get('api_filters', {})
+            }
+            try:
+                if user_data['id'] == 'unknown':
+                    job = jobs.enqueue('sync_timeline_v2', payload)
+                else:
+                    job = jobs.enqueue_unique('sync_timeline_v2', payload, key='user_id')
+            except Exception as e:
+                logger.error("Could not queue API fetch: %s", e)
+    
+    # ALWAYS query and filter posts from database (works with or without API)
+    session['user_data'] = user_data
+    
+    # Rendered pages are reused until timeline_data changes; pages with a job banner are not
+    if job is None:
+        key = cache_key('timeline_v2', request.args, user_data)
+        version = TimelineData.cache_version()
+        cached = timeline_cache.get(key, version)
+        if cached is not None:
+            return cached
+    
+    posts, next_cursor = fetch_timeline_page(TimelineData)
     
-    print(f"\n=== TIMELINE DEBUG ===")
-    print(f"Total posts in timeline_data: {TimelineData.query.count()}")
-    print(f"Posts after filtering: {len(filtered_posts)}")
-    print(f"=== END DEBUG ===\n")
+    # The count is an extra full query, so only run it when debugging
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("timeline_data holds %d posts; %d on this page",
+                     TimelineData.query.count(), len(posts))
     
-    return render_template('timeline.html', posts=filtered_posts, user_data=user_data)
+    html = render_template(
+        'timeline.html',
+        posts=posts,
+        user_data=user_data,
+        post_data=timeline_post_data(posts),
+        next_page_url=next_page_url('timeline_v2_page', next_cursor),
+        job=job.to_dict() if job else None,
+        job_done_url=url_for('timeline_v2')
+    )
+    if job is None:
+        timeline_cache.put(key, version, html)
+    return html
+
+@app.route('/timeline-v2/page')
+def timeline_v2_page():
+    """JSON next-page endpoint for infinite scroll on /timeline-v2"""
+    return timeline_page_json(TimelineData, 'timeline_v2_page')
 
-def process_attachments_v2(post_data, downloader, created_time, quality='high'):
+def queue_attachment_downloads(post_data, downloads, created_time, quality='high'):
     """
-    Process attachments and DOWNLOAD media files locally
-    Handles pagination for large albums
+    Start downloading every photo and video attached to a post, including
+    all pages of large albums, without waiting for the downloads to finish
+
+    Args:
+        downloads: DownloadPool the downloads are submitted to
+
+    Returns:
+        (photo_futures, video_futures, links) in attachment order
     """
-    photos = []
-    videos = []
+    photo_futures = []
+    video_futures = []
     links = []
     
-    attachments = post_data.get('attachments', {}).get('data', [])
-    
-    for attachment in attachments:
-        attachment_type = attachment.get('type', '')
-        media_type = attachment.get('media_type', '')
+    def queue_media(item):
+        """Queue a photo or video attachment/subattachment; ignore anything else"""
+        item_type = item.get('type', '')
+        item_media_type = item.get('media_type', '')
+        media = item.get('media', {})
         
-        # Handle photos - DOWNLOAD THEM
-        if attachment_type == 'photo' or media_type == 'photo':
-            media = attachment.get('media', {})
+        if item_type == 'photo' or item_media_type == 'photo':
             if 'image' in media and 'src' in media['image']:
-                photo_url = media['image']['src']
-                downloaded = downloader.download_photo(photo_url, created_time, quality)
-                if downloaded:
-                    photos.append(downloaded)
+                photo_futures.append(downloads.photo(media['image']['src'], created_time, quality))
         
-        # Handle videos - DOWNLOAD THEM
-        elif attachment_type == 'video' or media_type == 'video':
-            media = attachment.get('media', {})
+        elif item_type == 'video' or item_media_type == 'video':
             video_url = media.get('source', '')
             thumbnail_url = media.get('image', {}).get('src', '')
-            
             if video_url:
-                downloaded = downloader.download_video(video_url, created_time, thumbnail_url)
-                if downloaded:
-                    videos.append(downloaded)
+                video_futures.append(downloads.video(video_url, created_time, thumbnail_url))
+    
+    attachments = post_data.get('attachments', {}).get('data', [])
+    
+    for attachment in attachments:
+        attachment_type = attachment.get('type', '')
+        media_type = attachment.get('media_type', '')
+        
+        # Handle photos and videos - DOWNLOAD THEM
+        if attachment_type in ('photo', 'video') or media_type in ('photo', 'video'):
+            queue_media(attachment)
         
         # Handle albums - WITH PAGINATION
         elif attachment_type == 'album':
             subattachments_data = attachment.get('subattachments', {})
             subattachments = subattachments_data.get('data', [])
+            logger.debug("Album found: %d initial items", len(subattachments))
             
-            # DEBUG: Print the entire subattachments structure
-            print(f"\n=== ALBUM DEBUG ===")
-            print(f"  Initial items: {len(subattachments)}")
-            print(f"  Subattachments keys: {subattachments_data.keys()}")
-            if 'paging' in subattachments_data:
-                print(f"  Paging found!")
-                print(f"  Paging keys: {subattachments_data['paging'].keys()}")
-                print(f"  Next URL: {subattachments_data['paging'].get('next', 'None')[:100]}...")
-            else:
-                print(f"  NO PAGING FIELD - all items returned")
-            print(f"=== END ALBUM DEBUG ===\n")            
-            print(f"  Album found: {len(subattachments)} initial items")
-            
-            # Process initial subattachments
             for subattachment in subattachments:
-                sub_type = subattachment.get('type', '')
-                sub_media_type = subattachment.get('media_type', '')
-                
-                if sub_type == 'photo' or sub_media_type == 'photo':
-                    media = subattachment.get('media', {})
-                    if 'image' in media and 'src' in media['image']:
-                        photo_url = media['image']['src']
-                        downloaded = downloader.download_photo(photo_url, created_time, quality)
-                        if downloaded:
-                            photos.append(downloaded)
-                
-                elif sub_type == 'video' or sub_media_type == 'video':
-                    media = subattachment.get('media', {})
-                    video_url = media.get('source', '')
-                    thumbnail_url = media.get('image', {}).get('src', '')
-                    
-                    if video_url:
-                        downloaded = downloader.download_video(video_url, created_time, thumbnail_url)
-                        if downloaded:
-                            videos.append(downloaded)
+                queue_media(subattachment)
             
-            # PAGINATION: Check if there are more subattachments
-            paging = subattachments_data.get('paging', {})
-            next_url = paging.get('next')
+            # PAGINATION: later pages are fetched while earlier items download
+            next_url = subattachments_data.get('paging', {}).get('next')
             
             page_count = 1
             while next_url and page_count < 10:  # Limit to 10 pages max (safety)
-                print(f"  Fetching album page {page_count + 1}...")
+                logger.debug("Fetching album page %d", page_count + 1)
                 try:
-                    page_response = requests.get(next_url, timeout=30)
+                    page_response = http_get(next_url, timeout=30)
                     page_data = page_response.json()
                     
                     page_items = page_data.get('data', [])
-                    print(f"  Found {len(page_items)} more items on page {page_count + 1}")
+                    logger.debug("Found %d more items on page %d", len(page_items), page_count + 1)
                     
                     for subattachment in page_items:
-                        sub_type = subattachment.get('type', '')
-                        sub_media_type = subattachment.get('media_type', '')
-                        
-                        if sub_type == 'photo' or sub_media_type == 'photo':
-                            media = subattachment.get('media', {})
-                            if 'image' in media and 'src' in media['image']:
-                                photo_url = media['image']['src']
-                                downloaded = downloader.download_photo(photo_url, created_time, quality)
-                                if downloaded:
-                                    photos.append(downloaded)
-                        
-                        elif sub_type == 'video' or sub_media_type == 'video':
-                            media = subattachment.get('media', {})
-                            video_url = media.get('source', '')
-                            thumbnail_url = media.get('image', {}).get('src', '')
-                            
-                            if video_url:
-                                downloaded = downloader.download_video(video_url, created_time, thumbnail_url)
-                                if downloaded:
-                                    videos.append(downloaded)
+                        queue_media(subattachment)
                     
                     # Get next page URL
                     next_url = page_data.get('paging', {}).get('next')
                     page_count += 1
                     
                 except Exception as e:
-                    print(f"  Error fetching album page: {e}")
+                    logger.warning("Error fetching album page: %s", e)
                     break
-            
-            print(f"  Album total: {len(photos)} photos, {len(videos)} videos")
         
         # Links remain the same
         elif attachment_type == 'share' or attachment_type == 'link':
@@ -900,13 +1134,135 @@ def process_attachments_v2(post_data, downloader, created_time, quality='high'):
             
             links.append(link_data)
     
+    return photo_futures, video_futures, links
+
+def collect_attachment_downloads(pending_media):
+    """Wait for queued downloads, keeping attachment order and dropping failures"""
+    photo_futures, video_futures, links = pending_media
+    photos = [photo for photo in (future.result() for future in photo_futures) if photo]
+    videos = [video for video in (future.result() for future in video_futures) if video]
     return photos, videos, links
 
 @app.route('/uploads/<path:filename>')
 def serve_all_media(filename):
-    """Serve all uploaded media (extracted imports and API downloads)"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """
+    Serve all uploaded media (extracted imports and API downloads)
+
+    Media files are never rewritten in place, so responses carry a strong
+    ETag and a year-long immutable Cache-Control. Range requests get 206
+    partial responses for video seeking. With MEDIA_SENDFILE set to
+    'nginx' or 'apache', the front proxy delivers the file instead.
+    
+    JPEG requests are answered with the AVIF or WebP sibling when one
+    exists and the Accept header allows it.
+    """
+    upload_folder = app.config['UPLOAD_FOLDER']
+    path = safe_join(upload_folder, filename)
+    if path is None:
+        abort(404)
+    # Absolute, so the checks below and send_file (which would resolve a
+    # relative path against app.root_path) look at the same file
+    path = os.path.abspath(path)
+    if not os.path.isfile(path):
+        abort(404)
+    
+    negotiated = path.lower().endswith(('.jpg', '.jpeg'))
+    if negotiated:
+        # Only explicit listings count: browsers send */* whether or not they decode AVIF
+        accepted = {mimetype for mimetype, quality in request.accept_mimetypes if quality > 0}
+        for fmt in ALTERNATE_FORMATS:
+            candidate = alternate_path(path, fmt)
+            if f'image/{fmt}' in accepted and os.path.isfile(candidate):
+                filename = alternate_path(filename, fmt)
+                path = candidate
+                break
+    
+    stat = os.stat(path)
+    etag = f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+    max_age = app.config['MEDIA_MAX_AGE']
+    mode = app.config['MEDIA_SENDFILE']
+    
+    if mode in ('nginx', 'apache') and request.if_none_match.contains(etag):
+        # Revalidation is answered here without involving the proxy
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+    elif mode == 'nginx':
+        response = app.response_class(status=200)
+        response.headers['X-Accel-Redirect'] = app.config['MEDIA_ACCEL_PREFIX'].rstrip('/') + '/' + filename
+        response.headers['Content-Type'] = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        response.set_etag(etag)
+    elif mode == 'apache':
+        response = app.response_class(status=200)
+        response.headers['X-Sendfile'] = path
+        response.headers['Content-Type'] = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        response.set_etag(etag)
+    else:
+        # conditional=True answers If-None-Match with 304 and Range with 206
+        response = send_file(path, conditional=True, etag=etag, max_age=max_age)
+    
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+    if negotiated:
+        response.vary.add('Accept')
+    return response
+
 
+def run_import(filepath, progress=None, start_date=None, end_date=None):
+    """
+    Import an uploaded export zip (runs in a worker)
+
+    With IMPORT_STREAMING (the default) JSON is parsed straight from the
+    archive and only media referenced by imported posts is extracted;
+    otherwise the whole archive is extracted first. start_date/end_date
+    (YYYY-MM-DD, inclusive) limit the posts and comments imported.
+
+    An import that stops raises, failing the job; retrying it resumes from
+    the import's checkpoint.
+    """
+    import zipfile
+    extract_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'extracted')
+    os.makedirs(extract_dir, exist_ok=True)
+    
+    if app.config['IMPORT_STREAMING']:
+        source = ZipSource(filepath, extract_dir)
+    else:
+        if progress:
+            progress({'stage': 'extracting'})
+        with zipfile.ZipFile(filepath, 'r') as zip_ref:
+            zip_ref.extractall(extract_dir)
+        source = DirectorySource(extract_dir)
+    
+    # Import data
+    with source:
+        importer = FacebookDataImporter(
+            extract_dir,
+            batch_size=app.config['IMPORT_BATCH_SIZE'],
+            thumbnail_workers=app.config['THUMBNAIL_WORKERS'],
+            parse_workers=app.config['IMPORT_WORKERS'],
+            checkpoint_key=(f"{os.path.basename(filepath)}:{os.path.getsize(filepath)}:"
+                            f"{start_date or ''}:{end_date or ''}"),
+            progress=progress,
+            source=source
+        )
+        stats = importer.import_all(start_date, end_date)
+    
+    if isinstance(source, ZipSource):
+        logger.info("Extracted %d of %d archive members (%dMB)", source.extracted,
+                    len(source.members), source.extracted_bytes // (1024 * 1024))
+    
+    # Clean up; a failed import never gets here, so its archive stays for /jobs/<id>/retry
+    os.remove(filepath)
+    
+    # Keep the stored result small; the page shows the first few errors
+    stats['error_count'] = len(stats['errors'])
+    stats['errors'] = stats['errors'][:5]
+    return stats
+
+@jobs.handler('import_data')
+def import_data_job(payload, progress):
+    return run_import(payload['filepath'], progress,
+                      payload.get('start_date'), payload.get('end_date'))
 
 @app.route('/import-data', methods=['GET', 'POST'])
 def import_data():
@@ -920,37 +1276,56 @@ def import_data():
             flash('No file selected', 'error')
             return redirect(request.url)
         
+        # Optional date window; empty fields leave that side open
+        start_date = request.form.get('start_date') or None
+        end_date = request.form.get('end_date') or None
+        for value in (start_date, end_date):
+            if value and parse_display_date(value) is None:
+                flash('Invalid date. Please use YYYY-MM-DD.', 'error')
+                return redirect(request.url)
+        if start_date and end_date and start_date > end_date:
+            flash('Start date must not be after end date', 'error')
+            return redirect(request.url)
+        
         if file and file.filename.endswith('.zip'):
             filename = secure_filename(file.filename)
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             file.save(filepath)
             
-            # Extract zip
-            import zipfile
-            extract_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'extracted')
-            os.makedirs(extract_dir, exist_ok=True)
-            
-            with zipfile.ZipFile(filepath, 'r') as zip_ref:
-                zip_ref.extractall(extract_dir)
-            
-            # Import data
-            importer = FacebookDataImporter(extract_dir)
-            stats = importer.import_all()
-            
-            # Clean up
-            os.remove(filepath)
-            
-            flash(f"Import complete! Posts: {stats['posts_imported']} imported, "
-                  f"{stats['posts_updated']} updated, {stats['posts_skipped']} skipped. "
-                  f"Comments: {stats['comments_imported']} imported.", 'success')
+            # Extraction and import run in a background worker; the page polls the job
+            job = jobs.enqueue('import_data', {'filepath': filepath,
+                                               'start_date': start_date,
+                                               'end_date': end_date})
+            flash(f"Upload received. Import queued as job {job.id}.", 'info')
             
-            if stats['errors']:
-                for error in stats['errors'][:5]:  # Show first 5 errors
-                    flash(error, 'warning')
-            
-            return render_template('import.html')
+            return render_template('import.html', job=job.to_dict())
     
-    return render_template('import.html')
+    return render_template('import.html', job=None)
+
+@app.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    """JSON status and progress of a background job, polled by the templates"""
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<int:job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    """Queue a failed import again; it resumes from the checkpoint the failed run left"""
+    job = db.session.get(Job, job_id)
+    if job is None:
+        abort(404)
+    if job.kind != 'import_data' or job.status != 'failed':
+        flash('Only failed imports can be retried', 'error')
+        return redirect(url_for('import_data'))
+    if not os.path.exists(job.payload.get('filepath', '')):
+        flash('The uploaded archive is gone. Please upload it again.', 'error')
+        return redirect(url_for('import_data'))
+
+    retry = jobs.enqueue('import_data', dict(job.payload))
+    flash(f"Import queued again as job {retry.id}; it resumes where job {job.id} stopped.", 'info')
+    return render_template('import.html', job=retry.to_dict())
 
 
 
@@ -1021,26 +1396,35 @@ def refresh_comments(post_id):
     if post:
         post.comments = comments if comments else None
         
-        # Update Comment table
-        for comment in comments:
-            existing_comment = Comment.query.filter_by(facebook_id=comment['id']).first()
-            if not existing_comment:
-                new_comment = Comment(
-                    facebook_id=comment['id'],
-                    post_id=post_id,
-                    message=comment['message'],
-                    created_time=comment['created_time'],
-                    from_data=comment['from'],
-                    like_count=comment['like_count']
-                )
-                db.session.add(new_comment)
-        
+        # Update Comment table: new comments inserted, like counts refreshed
+        upsert_comments(comment_rows(post_id, comments))
         db.session.commit()
     
     return redirect(url_for('timeline'))
 
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Add new columns and indexes to an existing database and backfill them"""
+    upgrade_schema()
+    click.echo('Database schema is up to date')
+
+@app.cli.command('backfill-variants')
+@click.option('--batch-size', default=200, show_default=True)
+def backfill_variants_command(batch_size):
+    """Generate responsive width variants for photos stored before they existed"""
+    updated = backfill_variants(TimelineData, app.config['UPLOAD_FOLDER'], batch_size)
+    click.echo(f'Added variants to {updated} posts')
+
+@app.cli.command('worker')
+@click.option('--once', is_flag=True, help='Exit when the queue is empty instead of polling')
+def worker_command(once):
+    """Run background jobs (API fetches, imports); start as many as needed"""
+    configure_logging(os.getenv('LOG_LEVEL', 'INFO'))  # Workers report job progress by default
+    jobs.run_worker(once=once)
+
 if __name__ == '__main__':
+    configure_logging(os.getenv('LOG_LEVEL', 'DEBUG'))  # Matches debug=True below
     with app.app_context():
-        db.create_all()
+        upgrade_schema()
     app.run(debug=True, port=5000)
     
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Normalisation of Facebook export post records
+Pure functions and the DateWindow filter, with no database, media or app
+access, so ParsePool worker processes can run them; FacebookDataImporter finishes each normalised post
+(media checks, duplicate detection, ids) as the single writer.
+"""
+
+import re
+from datetime import datetime, timedelta, timezone
+
+_TIMESTAMP_FIELD = re.compile(r'"timestamp"\s*:\s*(-?\d+)')
+_SCAN_CHUNK = 1024 * 1024
+
+
+def _day_start(date, days=0):
+    """Epoch seconds at local midnight of a YYYY-MM-DD date (plus days), or None"""
+    if not date:
+        return None
+    return int((datetime.strptime(date, '%Y-%m-%d') + timedelta(days=days)).timestamp())
+
+
+class DateWindow:
+    """
+    Inclusive YYYY-MM-DD range of posts to import; either end may be None
+
+    Bounds are compared with the raw integer timestamps of export records.
+    They are local midnights because extract_timestamp formats timestamps
+    in local time, so a record passes exactly when its created_time date
+    falls in the range.
+    """
+
+    def __init__(self, start_date=None, end_date=None):
+        self.start_date = start_date or None
+        self.end_date = end_date or None
+        self.start = _day_start(self.start_date)
+        self.end = _day_start(self.end_date, days=1)  # exclusive
+
+    @property
+    def bounded(self):
+        return self.start is not None or self.end is not None
+
+    def _excludes_timestamp(self, timestamp):
+        return ((self.start is not None and timestamp < self.start) or
+                (self.end is not None and timestamp >= self.end))
+
+    def excludes(self, record):
+        """True if the record is outside the window, judged from its raw timestamp"""
+        timestamp = record.get('timestamp', 0)
+        if isinstance(timestamp, int):
+            return self._excludes_timestamp(timestamp)
+        date = str(record.get('created_time', ''))[:10]
+        return bool((self.start_date and date < self.start_date) or
+                    (self.end_date and date > self.end_date))
+
+    def may_overlap(self, f):
+        """
+        False only if the file certainly holds nothing in the window: it has
+        "timestamp" values, none of them inside, and no created_time fields
+
+        Scans the raw text with a regex, which is far cheaper than decoding
+        the JSON, and stops at the first timestamp inside. Closes f.
+        """
+        found = False
+        tail = ''
+        with f:
+            if not self.bounded:
+                return True
+            while True:
+                chunk = f.read(_SCAN_CHUNK)
+                if not chunk:
+                    break
+                # Carry a little text over so a field split across chunks is seen whole
+                text = tail + chunk
+                tail = text[-64:]
+                if '"created_time"' in text:
+                    return True
+                for match in _TIMESTAMP_FIELD.finditer(text):
+                    found = True
+                    if not self._excludes_timestamp(int(match.group(1))):
+                        return True
+        return not found
+
+    def created_at_range(self, days=1):
+        """UTC datetimes bounding stored posts within `days` of the window, for preloading"""
+        since = until = None
+        if self.start_date:
+            since = datetime.strptime(self.start_date, '%Y-%m-%d').replace(tzinfo=timezone.utc) - timedelta(days=days)
+        if self.end_date:
+            until = datetime.strptime(self.end_date, '%Y-%m-%d').replace(tzinfo=timezone.utc) + timedelta(days=days + 1)
+        return since, until
+
+    def __str__(self):
+        return f"{self.start_date or 'start'}..{self.end_date or 'end'}"
+
+
+def extract_message(post_data):
+    """Extract post message from various Facebook export formats"""
+    message = ''
+
+    if 'data' in post_data and isinstance(post_data['data'], list):
+        if post_data['data']:
+            message = post_data['data'][0].get('post', '')
+    else:
+        message = post_data.get('message', '')
+
+    if message:
+        try:
+            message = message.encode('latin1').decode('utf-8')
+        except (UnicodeDecodeError, UnicodeEncodeError):
+            pass
+
+    return message
+
+
+def extract_timestamp(post_data):
+    """Extract and normalize timestamp"""
+    timestamp = post_data.get('timestamp', 0)
+    if isinstance(timestamp, int):
+        dt = datetime.fromtimestamp(timestamp)
+        return dt.strftime('%Y-%m-%dT%H:%M:%S+0000')
+    return post_data.get('created_time', '')
+
+
+def is_video_uri(uri):
+    return 'video' in uri.lower() or uri.endswith(('.mp4', '.mov', '.avi'))
+
+
+def classify_attachments(post_data):
+    """
+    Classify a post's attachment items in one pass
+
+    Returns:
+        (media, links): media is a list of {'uri', 'video', 'title',
+        'description'} dicts still to be checked against the export;
+        links is None when empty
+    """
+    media_items = []
+    links = []
+
+    for attachment in post_data.get('attachments', []):
+        for item in attachment.get('data', []):
+            media = item.get('media')
+            if media and 'uri' in media:
+                media_items.append({
+                    'uri': media['uri'],
+                    'video': is_video_uri(media['uri']),
+                    'title': media.get('title', ''),
+                    'description': media.get('description', '')
+                })
+
+            if 'external_context' in item:
+                ext = item['external_context']
+                links.append({
+                    'url': ext.get('url', ''),
+                    'title': item.get('title', ''),
+                    'description': item.get('description', ''),
+                    'thumbnail': '',
+                    'domain': ext.get('url', '').split('/')[2] if ext.get('url') else ''
+                })
+
+    return media_items, links or None
+
+
+def normalize_post(post_data, window=None):
+    """
+    Everything about importing a post that needs only the record itself
+
+    Returns:
+        dict with created_time, message, media, links and id_text (the raw
+        text the post id is derived from), or None if the post is outside
+        the DateWindow
+    """
+    # Checked before any formatting, decoding or attachment work
+    if window is not None and window.excludes(post_data):
+        return None
+
+    created_time = extract_timestamp(post_data)
+    media, links = classify_attachments(post_data)
+    return {
+        'created_time': created_time,
+        'message': extract_message(post_data),
+        'media': media,
+        'links': links,
+        'id_text': str(post_data.get('data', [{}])[0].get('post', ''))
+    }
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Where FacebookDataImporter reads an export from
+DirectorySource wraps an already extracted export. ZipSource reads the
+uploaded archive in place: JSON members are parsed straight from the zip
+and media members are extracted one by one, only when an imported post
+references them.
+"""
+
+import io
+import logging
+import os
+import posixpath
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+
+def _member_name(path):
+    """Normalise a path into the posix form used for manifest keys and zip members"""
+    return posixpath.normpath(path.replace(os.sep, '/')).lstrip('/') if path else ''
+
+
+class DirectorySource:
+    """
+    An export that has already been extracted to `root`
+
+    The tree is walked once with os.scandir on first use; every existence
+    check afterwards is answered from that manifest instead of a stat call.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.spec = ('directory', root)
+        self._manifest = None
+        self._dirs = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        pass
+
+    @property
+    def manifest(self):
+        """{relative posix path: (size, mtime)} for every file under root"""
+        if self._manifest is None:
+            self._scan()
+        return self._manifest
+
+    def _scan(self):
+        manifest = {}
+        dirs = {''}
+        pending = ['']
+        while pending:
+            relative = pending.pop()
+            try:
+                entries = os.scandir(os.path.join(self.root, relative))
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    name = f"{relative}/{entry.name}" if relative else entry.name
+                    if entry.is_dir():
+                        dirs.add(name)
+                        pending.append(name)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        manifest[name] = (stat.st_size, stat.st_mtime)
+        self._manifest = manifest
+        self._dirs = dirs
+        logger.info("Export manifest: %d files in %d directories", len(manifest), len(dirs))
+
+    def isdir(self, path):
+        if self._dirs is None:
+            self._scan()
+        return _member_name(path) in self._dirs
+
+    def isfile(self, path):
+        return _member_name(path) in self.manifest
+
+    def size(self, path):
+        return self.manifest[_member_name(path)][0]
+
+    def listdir(self, path):
+        return os.listdir(os.path.join(self.root, path))
+
+    def open_text(self, path):
+        return open(os.path.join(self.root, path), 'r', encoding='utf-8')
+
+    def open_binary(self, path):
+        return open(os.path.join(self.root, path), 'rb')
+
+    def ensure_media(self, uri):
+        """True if the media file is present under root"""
+        return self.isfile(uri)
+
+
+class ZipSource:
+    """
+    An export zip read through its central directory
+
+    Media members are extracted to `extract_dir` on demand, keeping their
+    archive paths, so imported posts reference the same /uploads/extracted/
+    paths as a full extraction would produce.
+    """
+
+    def __init__(self, zip_path, extract_dir):
+        self.extract_dir = extract_dir
+        self.spec = ('zip', zip_path, extract_dir)
+        self.zip = zipfile.ZipFile(zip_path, 'r')
+        self.members = {}
+        self.dirs = {''}
+        for info in self.zip.infolist():
+            name = info.filename.rstrip('/')
+            if info.is_dir():
+                self.dirs.add(name)
+                continue
+            self.members[name] = info
+            parent = posixpath.dirname(name)
+            while parent not in self.dirs:
+                self.dirs.add(parent)
+                parent = posixpath.dirname(parent)
+        self.extracted = 0
+        self.extracted_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.zip.close()
+
+    def isdir(self, path):
+        return _member_name(path) in self.dirs
+
+    def isfile(self, path):
+        return _member_name(path) in self.members
+
+    def size(self, path):
+        return self.members[_member_name(path)].file_size
+
+    def listdir(self, path):
+        prefix = _member_name(path)
+        prefix = prefix + '/' if prefix and prefix != '.' else ''
+        entries = set()
+        for name in list(self.members) + list(self.dirs):
+            if name.startswith(prefix) and name != prefix.rstrip('/'):
+                rest = name[len(prefix):]
+                if rest:
+                    entries.add(rest.split('/', 1)[0])
+        return sorted(entries)
+
+    def open_text(self, path):
+        return io.TextIOWrapper(self.open_binary(path), encoding='utf-8')
+
+    def open_binary(self, path):
+        return self.zip.open(self.members[_member_name(path)])
+
+    def ensure_media(self, uri):
+        """Extract the media member if needed; False if the archive lacks it"""
+        info = self.members.get(_member_name(uri))
+        if info is None:
+            return False
+
+        target = os.path.join(self.extract_dir, *info.filename.split('/'))
+        if os.path.isfile(target) and os.path.getsize(target) == info.file_size:
+            return True
+
+        self.zip.extract(info, self.extract_dir)
+        self.extracted += 1
+        self.extracted_bytes += info.file_size
+        return True
+
+
+def open_source(spec):
+    """Reopen a source from its spec, e.g. in another process"""
+    kind, *args = spec
+    return ZipSource(*args) if kind == 'zip' else DirectorySource(*args)
@@ -4,42 +4,22 @@
 Facebook Data Importer with File Existence Validation
 """
 
+import hashlib
 import json
+import logging
 import os
-from datetime import datetime, timedelta
+from itertools import islice
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from models_v2 import TimelineData
-from models import db, Comment  # Import db and Comment from original models
-from sqlalchemy import and_
-import subprocess
-from PIL import Image
-from io import BytesIO
-
-def _generate_video_thumbnail(self, video_path):
-    """Generate thumbnail from video file using ffmpeg"""
-    try:
-        # Output path for thumbnail
-        thumbnail_path = video_path.rsplit('.', 1)[0] + '_thumb.jpg'
-        
-        # Use ffmpeg to extract frame at 1 second
-        cmd = [
-            'ffmpeg',
-            '-i', video_path,
-            '-ss', '00:00:01',  # Grab frame at 1 second
-            '-vframes', '1',
-            '-q:v', '2',  # Quality
-            thumbnail_path,
-            '-y'  # Overwrite if exists
-        ]
-        
-        subprocess.run(cmd, capture_output=True, check=True)
-        
-        # Return relative path
-        return thumbnail_path.replace('uploads/', '/uploads/')
-        
-    except Exception as e:
-        print(f"    ⚠️  Failed to generate thumbnail: {e}")
-        return None
+from models import db, Comment, ImportCheckpoint, bulk_insert_ignore  # Import db and Comment from original models
+from json_stream import iter_records
+from export_source import DirectorySource
+from export_posts import DateWindow, extract_message, extract_timestamp, normalize_post
+from parse_pool import ParsePool
+from fingerprints import DuplicateIndex, normalize_message
+from thumbnails import ThumbnailPool
 
+logger = logging.getLogger(__name__)
 
 
 class FacebookDataImporter:
@@ -52,8 +32,23 @@ class FacebookDataImporter:
     - photos_and_videos/ (optional)
     """
     
-    def __init__(self, data_directory):
+    def __init__(self, data_directory, batch_size=500, thumbnail_workers=None, progress=None,
+                 source=None, parse_workers=1, checkpoint_key=None):
         self.data_directory = data_directory
+        # Where export files are read from; media always ends up under data_directory
+        self.source = source or DirectorySource(data_directory)
+        self.batch_size = batch_size
+        self.thumbnail_workers = thumbnail_workers
+        self.parse_workers = parse_workers  # >1 parses post files in a process pool; None = one per core
+        self.progress = progress  # Optional callable given the running counts after each batch
+        self.checkpoint_key = checkpoint_key  # Identifies the export; None disables checkpoints
+        self._resume = {}  # Position loaded from a checkpoint
+        self._files_done = []
+        self._position = None  # (stage, file, records handled) of the latest record
+        self.window = DateWindow()
+        self._pending_posts = []
+        self._pending_comments = []
+        self._pending_thumbnails = []
         self.stats = {
             'posts_imported': 0,
             'posts_skipped': 0,
@@ -63,28 +58,79 @@ class FacebookDataImporter:
             'errors': []
         }
         
-    def import_all(self, start_date='2023-05-01', end_date='2023-05-31'):
-        """Import all available data from Facebook export"""
+    def import_all(self, start_date=None, end_date=None):
+        """
+        Import all available data from Facebook export
+        
+        Args:
+            start_date, end_date: inclusive YYYY-MM-DD bounds on the posts
+                and comments imported; None leaves that side open
+        
+        Raises:
+            whatever stopped the import, after the last committed batch's
+            checkpoint has been saved
+        """
+        self.thumbnails = ThumbnailPool(self.thumbnail_workers)
         try:
-            self.date_filter = {'start': start_date, 'end': end_date}
-            self.import_posts()
+            self.window = DateWindow(start_date, end_date)
+            self._load_checkpoint()
+            if self._resume.get('stage') != 'comments':
+                self.import_posts()
             self.import_comments()
+            self._clear_checkpoint()
             return self.stats
-        except Exception as e:
-            self.stats['errors'].append(f"Import failed: {str(e)}")
-            return self.stats
+        except Exception:
+            # The checkpoint stays, so importing the same export again resumes
+            logger.exception("Import stopped at %s", self._position)
+            raise
+        finally:
+            self.thumbnails.shutdown()
+    
+    def _load_checkpoint(self):
+        """Restore the position and counts of an earlier, unfinished run of this export"""
+        if not self.checkpoint_key:
+            return
+        checkpoint = db.session.get(ImportCheckpoint, self.checkpoint_key)
+        if checkpoint is None:
+            return
+        self._resume = checkpoint.position
+        self._files_done = list(self._resume.get('files_done', []))
+        self.stats.update(checkpoint.stats)
+        logger.info("Resuming import %s at %s %s, record %d", self.checkpoint_key,
+                    self._resume.get('stage'), self._resume.get('file'), self._resume.get('offset', 0))
+    
+    def _advance(self, stage, filepath, offset):
+        """Note that the first `offset` records of filepath have been handled"""
+        if self._position and self._position[:2] != (stage, filepath) and self._position[0] == stage:
+            self._files_done.append(self._position[1])
+        self._position = (stage, filepath, offset)
+    
+    def _save_checkpoint(self):
+        """Persist the position reached; called once a batch has been committed"""
+        if not self.checkpoint_key or not self._position:
+            return
+        stage, filepath, offset = self._position
+        position = {'stage': stage, 'files_done': self._files_done, 'file': filepath, 'offset': offset}
+        stats = dict(self.stats, errors=self.stats['errors'][:100])
+        db.session.execute(
+            pg_insert(ImportCheckpoint.__table__)
+            .values(import_key=self.checkpoint_key, position=position, stats=stats)
+            .on_conflict_do_update(index_elements=['import_key'],
+                                   set_={'position': position, 'stats': stats, 'updated_at': db.func.now()})
+        )
+        db.session.commit()
+    
+    def _clear_checkpoint(self):
+        if not self.checkpoint_key:
+            return
+        ImportCheckpoint.query.filter_by(import_key=self.checkpoint_key).delete()
+        db.session.commit()
     
     def _file_exists(self, uri):
-        """Check if a file actually exists on disk."""
-        full_path = os.path.join(self.data_directory, uri)
-        exists = os.path.isfile(full_path)
-        
-        print(f"          Checking file: {full_path}")
-        print(f"          File exists: {exists}")
-        
+        """Check the export manifest (or archive listing) for a media file, without extracting it"""
+        exists = self.source.isfile(uri)
         if not exists:
             self.stats['media_skipped'] += 1
-        
         return exists
     
     def import_posts(self):
@@ -97,16 +143,15 @@ class FacebookDataImporter:
         
         posts_dir = None
         for path in possible_paths:
-            test_path = os.path.join(self.data_directory, path)
-            if os.path.exists(test_path):
-                posts_dir = test_path
-                print(f"Found posts directory at: {posts_dir}")
+            if self.source.isdir(path):
+                posts_dir = path
+                logger.info("Found posts directory at: %s", posts_dir)
                 break
         
         if not posts_dir:
             self.stats['errors'].append(
                 f"No posts directory found. Searched: {possible_paths}. "
-                f"Available directories: {os.listdir(self.data_directory)}"
+                f"Available directories: {self.source.listdir('')}"
             )
             return
         
@@ -116,354 +161,316 @@ class FacebookDataImporter:
             'content_sharing_links_you_have_created.json'
         ]
     
-        for filename in os.listdir(posts_dir):
+        for filename in self.source.listdir(posts_dir):
             if filename.endswith('.json') and filename not in json_files_to_check:
                 json_files_to_check.append(filename)
         
-        print(f"Found JSON files in posts directory: {json_files_to_check}")
+        logger.debug("Found JSON files in posts directory: %s", json_files_to_check)
+        
+        # Existing fingerprints that could match a post in the window, plus everything queued during this run
+        since, until = self.window.created_at_range()
+        self.duplicates = DuplicateIndex(TimelineData, since=since, until=until)
         
+        filepaths = []
         for filename in json_files_to_check:
             filepath = os.path.join(posts_dir, filename)
-            if os.path.exists(filepath):
-                print(f"Processing: {filename}")
-                self._process_posts_file(filepath)
+            if filepath in self._files_done:
+                logger.debug("Skipping (finished before resume): %s", filename)
+            elif not self.source.isfile(filepath):
+                logger.debug("Skipping (not found): %s", filename)
+            elif self.window.bounded and not self.window.may_overlap(self.source.open_text(filepath)):
+                logger.info("Skipping (nothing in %s): %s", self.window, filename)
             else:
-                print(f"Skipping (not found): {filename}")
-            
-    def _process_posts_file(self, filepath):
-        """Process a single posts JSON file"""
+                filepaths.append(filepath)
+        
+        # Records of a partly imported file already committed before resuming
+        offsets = {}
+        if self._resume.get('stage') == 'posts' and self._resume.get('file'):
+            offsets[self._resume['file']] = self._resume.get('offset', 0)
+        
+        if self.parse_workers == 1:
+            for filepath in filepaths:
+                logger.info("Processing: %s", os.path.basename(filepath))
+                self._process_posts_file(filepath, offsets.get(filepath, 0))
+        else:
+            self._process_posts_parallel(filepaths, offsets)
+        
+        self._flush_posts()
+    
+    def _flush_batch(self, model, rows, kind):
+        """
+        Write a batch of row dicts in one transaction, returning how many were new.
+        If the batch fails, retry it row by row so one bad record only loses itself.
+        """
+        if not rows:
+            return 0
+        
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            print(f"File structure keys: {data.keys() if isinstance(data, dict) else 'list'}")
-            
-            posts = []
-            
-            if isinstance(data, list):
-                posts = data
-            elif isinstance(data, dict):
-                for key in ['posts', 'status_updates', 'photos', 'videos', 'data']:
-                    if key in data:
-                        posts = data[key] if isinstance(data[key], list) else [data[key]]
-                        break
-                
-                if not posts and 'timestamp' in data:
-                    posts = [data]
-            
-            print(f"Found {len(posts)} posts in {os.path.basename(filepath)}")
+            inserted = len(bulk_insert_ignore(model, rows))
+            db.session.commit()
+            return inserted
+        except Exception as e:
+            db.session.rollback()
+            logger.warning("Batch of %d %ss failed (%s), retrying individually", len(rows), kind, e)
+        
+        inserted = 0
+        for row in rows:
+            try:
+                inserted += len(bulk_insert_ignore(model, [row]))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.stats['errors'].append(f"Error importing {kind} {row.get('facebook_id')}: {str(e)}")
+        return inserted
+    
+    def _flush_posts(self):
+        """Insert pending posts; ones already present by facebook_id count as skipped"""
+        # Thumbnails for this batch have been generating while it was parsed
+        pending_thumbnails, self._pending_thumbnails = self._pending_thumbnails, []
+        for video, video_path in pending_thumbnails:
+            video['thumbnail'] = self.thumbnails.result(video_path) or ''
+        
+        rows, self._pending_posts = self._pending_posts, []
+        inserted = self._flush_batch(TimelineData, rows, 'post')
+        self.stats['posts_imported'] += inserted
+        self.stats['posts_skipped'] += len(rows) - inserted
+        if rows:
+            logger.info("Committed batch: %d of %d posts inserted", inserted, len(rows))
+            self._save_checkpoint()
+            self._report_progress()
+    
+    def _flush_comments(self):
+        """Insert pending comments, ignoring ones already present by facebook_id"""
+        rows, self._pending_comments = self._pending_comments, []
+        self.stats['comments_imported'] += self._flush_batch(Comment, rows, 'comment')
+        if rows:
+            self._save_checkpoint()
+            self._report_progress()
+    
+    def _report_progress(self):
+        """Pass the running counts (without the error list) to the progress callback"""
+        if self.progress:
+            counts = {key: value for key, value in self.stats.items() if key != 'errors'}
+            counts['errors'] = len(self.stats['errors'])
+            self.progress(counts)
+            
+    def _process_posts_file(self, filepath, start=0):
+        """Process a single posts JSON file, streaming one post at a time from record `start`"""
+        try:
+            post_count = start
+            for post_data in islice(iter_records(self.source.open_text(filepath)), start, None):
+                post_count += 1
+                self._advance('posts', filepath, post_count)
+                self._import_single_post(post_data)
             
-            for post_data in posts:
-                self._import_single_post(post_data)            
+            logger.info("Found %d posts in %s", post_count, os.path.basename(filepath))
     
         except json.JSONDecodeError as e:
             self.stats['errors'].append(f"Invalid JSON in {filepath}: {str(e)}")
         except Exception as e:
             self.stats['errors'].append(f"Error processing {filepath}: {str(e)}")           
-            
+    
+    def _process_posts_parallel(self, filepaths, offsets):
+        """
+        Parse and normalise posts files in a ParsePool; this process stays
+        the single writer, finishing posts in file order and batching inserts
+        """
+        post_counts = {}
+        with ParsePool(self.source, self.parse_workers, self.window) as pool:
+            logger.info("Parsing %d posts files with %d workers", len(filepaths), pool.workers)
+            for filepath, future in pool.results(filepaths, offsets):
+                post_counts.setdefault(filepath, offsets.get(filepath, 0))
+                try:
+                    posts = future.result()
+                except json.JSONDecodeError as e:
+                    self.stats['errors'].append(f"Invalid JSON in {filepath}: {str(e)}")
+                    continue
+                except Exception as e:
+                    self.stats['errors'].append(f"Error processing {filepath}: {str(e)}")
+                    continue
+                
+                for post in posts:
+                    post_counts[filepath] += 1
+                    self._advance('posts', filepath, post_counts[filepath])
+                    self._store_post(post)
+        
+        for filepath, post_count in post_counts.items():
+            logger.info("Found %d posts in %s", post_count, os.path.basename(filepath))
  
-    def _generate_post_id(self, post_data):
+    def _generate_post_id(self, post):
         """Generate a consistent ID for posts without one"""
-        timestamp = self._extract_timestamp(post_data)
-        message_hash = hash(str(post_data.get('data', [{}])[0].get('post', '')))
-        return f"import_{timestamp}_{abs(message_hash)}"
+        # A stable digest (hash() is salted per process) keeps ids equal across runs
+        message_hash = hashlib.sha1(post['id_text'].encode('utf-8')).hexdigest()[:16]
+        return f"import_{post['created_time']}_{message_hash}"
 
     def normalize_message(self, message):
         """Remove encoding differences for comparison"""
-        if not message:
-            return ""
-        return ' '.join(message.strip().split())
+        return normalize_message(message)
     
     def _extract_message(self, post_data):
         """Extract post message from various Facebook export formats"""
-        message = ''
-        
-        if 'data' in post_data and isinstance(post_data['data'], list):
-            if post_data['data']:
-                message = post_data['data'][0].get('post', '')
-        else:
-            message = post_data.get('message', '')
-        
-        if message:
-            try:
-                message = message.encode('latin1').decode('utf-8')
-            except (UnicodeDecodeError, UnicodeEncodeError):
-                pass
-        
-        return message    
+        return extract_message(post_data)
     
     def _extract_timestamp(self, post_data):
         """Extract and normalize timestamp"""
-        timestamp = post_data.get('timestamp', 0)
-        if isinstance(timestamp, int):
-            dt = datetime.fromtimestamp(timestamp)
-            return dt.strftime('%Y-%m-%dT%H:%M:%S+0000')
-        return post_data.get('created_time', '')
+        return extract_timestamp(post_data)
     
     def _import_single_post(self, post_data):
         """Import a single post, handling duplicates intelligently"""
         try:
-            created_time = self._extract_timestamp(post_data)
-            
-            # Skip posts outside May 2023 for testing
-            post_date = created_time[:10]
-            if post_date < '2023-05-01' or post_date > '2023-05-31':
-                self.stats['posts_skipped'] += 1
-                return
-            
-            print(f"\n  Processing post from {created_time}")
-            
-            # Extract all data first
-            message = self._extract_message(post_data)
-            print(f"    Message: {message[:50] if message else 'None'}...")
+            post = normalize_post(post_data, self.window)
+        except Exception as e:
+            logger.exception("Error importing post")
+            self.stats['errors'].append(f"Error importing post: {str(e)}")
+            return
+        self._store_post(post)
+    
+    def _store_post(self, post):
+        """
+        Finish a normalize_post result: check its media against the export,
+        drop duplicates and queue the row for the next batch
+
+        Media is only extracted, and video thumbnails only generated, once
+        the post is known not to be a duplicate.
+        """
+        if post is None:
+            # Outside the date window
+            self.stats['posts_skipped'] += 1
+            return
+        if 'error' in post:
+            self.stats['errors'].append(f"Error importing post: {post['error']}")
+            return
+        
+        try:
+            created_time = post['created_time']
+            message = post['message']
+            links = post['links']
+            logger.debug("Processing post from %s", created_time)
             
-            photos = self._extract_photos(post_data)
-            videos = self._extract_videos(post_data)
-            links = self._extract_links(post_data)
-            from_data = self._extract_author(post_data)
+            media_items = [media for media in post['media'] if self._file_exists(media['uri'])]
             
             # Create fingerprint for duplicate detection
-            photo_count = len(photos) if photos else 0
-            video_count = len(videos) if videos else 0
-            normalized_message = self.normalize_message(message) if message else ""
+            video_count = sum(1 for media in media_items if media['video'])
+            photo_count = len(media_items) - video_count
             
-            print(f"    Media counts - Photos: {photo_count}, Videos: {video_count}")
+            # Duplicate if a post within a day has the same message AND media counts
+            if self.duplicates.contains(message, photo_count, video_count, created_time):
+                logger.debug("Duplicate detected: %.50s...", self.normalize_message(message))
+                self.stats['posts_skipped'] += 1
+                return
+            self.duplicates.add(message, photo_count, video_count, created_time)
             
-            # Search for duplicates within 2-day window
-            try:
-                date_obj = datetime.strptime(created_time[:10], '%Y-%m-%d')
-                date_before = (date_obj - timedelta(days=1)).strftime('%Y-%m-%d')
-                date_after = (date_obj + timedelta(days=1)).strftime('%Y-%m-%d')
-                
-                existing_posts = TimelineData.query.filter(
-                    and_(
-                        TimelineData.created_time >= f"{date_before}T00:00:00",
-                        TimelineData.created_time <= f"{date_after}T23:59:59"
-                    )
-                ).all()
-                
-                print(f"    Found {len(existing_posts)} existing posts in date window")
-                
-                # Check each existing post for matching fingerprint
-                for existing in existing_posts:
-                    existing_photo_count = len(existing.photos) if existing.photos else 0
-                    existing_video_count = len(existing.videos) if existing.videos else 0
-                    existing_message = self.normalize_message(existing.message) if existing.message else ""
-                    
-                    # Duplicate if: same message AND same media counts
-                    if (normalized_message == existing_message and 
-                        photo_count == existing_photo_count and 
-                        video_count == existing_video_count):
-                        
-                        print(f"  🔍 Duplicate detected:")
-                        print(f"     Message match: {normalized_message[:50]}...")
-                        print(f"     Photos: {photo_count} (existing: {existing_photo_count})")
-                        print(f"     Videos: {video_count} (existing: {existing_video_count})")
-                        self.stats['posts_skipped'] += 1
-                        return
-            except Exception as e:
-                print(f"    ⚠️  Error in duplicate detection: {e}")
-                print(f"    Continuing with import anyway...")
+            photos, videos = self._extract_media(media_items)
+            from_data = self._extract_author(post)
             
             # Generate post ID
-            post_id = self._generate_post_id(post_data)
-            print(f"    Generated ID: {post_id}")
-            
-            # Create new post in TimelineData table
-            new_post = TimelineData(
-                facebook_id=post_id,
-                message=message,
-                created_time=created_time,
-                photos=photos,
-                videos=videos,
-                links=links,
-                from_data=from_data,
-                source='import'
-            )
-            
-            db.session.add(new_post)
-            self.stats['posts_imported'] += 1
-            print(f"  ✅ Added to session: {post_id}")
-            
-            db.session.commit()
-            print(f"  ✅ Committed to database")
+            post_id = self._generate_post_id(post)
+            
+            # Queue the new TimelineData row; it is written with the next batch
+            self._pending_posts.append({
+                'facebook_id': post_id,
+                'message': message,
+                'created_time': created_time,
+                'photos': photos,
+                'videos': videos,
+                'links': links,
+                'from_data': from_data,
+                'source': 'import'
+            })
+            logger.debug("Queued: %s", post_id)
+            
+            if len(self._pending_posts) >= self.batch_size:
+                self._flush_posts()
             
         except Exception as e:
-            print(f"  ❌ ERROR importing post: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error importing post")
             self.stats['errors'].append(f"Error importing post: {str(e)}")
-            db.session.rollback()    
-            
-    def _extract_photos(self, post_data):
-            """Extract photos from export format - ONLY if files exist"""
-            photos = []
-            
-            attachments = post_data.get('attachments', [])
-            print(f"    📸 Processing attachments, found {len(attachments)} attachment groups")
-            
-            for idx, attachment in enumerate(attachments):
-                if 'data' in attachment:
-                    print(f"      Attachment group {idx}: {len(attachment['data'])} items")
-                    for item_idx, item in enumerate(attachment['data']):
-                        if 'media' in item and 'uri' in item['media']:
-                            uri = item['media']['uri']
-                            print(f"        Item {item_idx}: URI = {uri}")
-                            
-                            is_video = 'video' in uri.lower() or uri.endswith(('.mp4', '.mov', '.avi'))
-                            print(f"          Is video? {is_video}")
-                            
-                            if not is_video:
-                                if self._file_exists(uri):
-                                    photos.append({
-                                        'src': f'/uploads/extracted/{uri}',
-                                        'width': 0,
-                                        'height': 0,
-                                        'url': '',
-                                        'title': item['media'].get('title', '')
-                                    })
-                                    print(f"          ✅ Added photo")
-                                else:
-                                    print(f"          ❌ Photo file not found")
-                            else:
-                                print(f"          ⏭️  Skipping (is video)")
             
-            print(f"    📸 Total photos added: {len(photos)}")
-            return photos if photos else None
+    def _extract_media(self, media_items):
+        """
+        Extract media already found in the export and build its photo and
+        video entries, starting thumbnail generation for the videos
         
-    def _extract_videos(self, post_data):
-        """Extract videos from export format - ONLY if files exist"""
+        Returns:
+            (photos, videos), each None when empty
+        """
+        photos = []
         videos = []
         
-        attachments = post_data.get('attachments', [])
-        print(f"    🎥 Processing video attachments, found {len(attachments)} attachment groups")
-        
-        for idx, attachment in enumerate(attachments):
-            if 'data' in attachment:
-                for item_idx, item in enumerate(attachment['data']):
-                    if 'media' in item and 'uri' in item['media']:
-                        uri = item['media']['uri']
-                        
-                        is_video = 'video' in uri.lower() or uri.endswith(('.mp4', '.mov', '.avi'))
-                        
-                        if is_video:
-                            if self._file_exists(uri):
-                                # Get full path for thumbnail generation
-                                full_video_path = os.path.join(self.data_directory, uri)
-                                
-                                # Generate thumbnail
-                                thumbnail = self._generate_video_thumbnail(full_video_path)
-                                
-                                videos.append({
-                                    'src': f'/uploads/extracted/{uri}',
-                                    'thumbnail': thumbnail or '',  # Use generated thumbnail
-                                    'url': '',
-                                    'title': item['media'].get('title', ''),
-                                    'description': item['media'].get('description', '')
-                                })
-                                print(f"          ✅ Added video with thumbnail: {thumbnail}")
-        
-        print(f"    🎥 Total videos added: {len(videos)}")
-        return videos if videos else None    
-
-    def _generate_video_thumbnail(self, video_path):
-        """Generate thumbnail from first frame of video"""
-        try:
-            from PIL import Image
-            import subprocess
-            
-            # Create thumbnail path
-            thumbnail_path = video_path.rsplit('.', 1)[0] + '_thumb.jpg'
-            
-            # Use ffmpeg to extract first frame
-            cmd = [
-                'ffmpeg',
-                '-i', video_path,
-                '-ss', '00:00:01',
-                '-vframes', '1',
-                '-vf', 'scale=320:-1',  # Resize to 320px wide
-                '-q:v', '2',
-                thumbnail_path,
-                '-y'
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            
-            if os.path.exists(thumbnail_path):
-                # Return web path
-                return thumbnail_path.replace('uploads/', '/uploads/')
-            else:
-                print(f"    ⚠️  Thumbnail generation failed")
-                return None
+        for media in media_items:
+            uri = media['uri']
+            if not self.source.ensure_media(uri):
+                continue
+            
+            if media['video']:
+                # Get full path for thumbnail generation
+                full_video_path = os.path.join(self.data_directory, uri)
                 
-        except Exception as e:
-            print(f"    ⚠️  Error generating thumbnail: {e}")
-            return None
-
-    def _extract_links(self, post_data):
-        """Extract shared links"""
-        links = []
-        attachments = post_data.get('attachments', [])
-        
-        for attachment in attachments:
-            if 'data' in attachment:
-                for item in attachment['data']:
-                    if 'external_context' in item:
-                        ext = item['external_context']
-                        links.append({
-                            'url': ext.get('url', ''),
-                            'title': item.get('title', ''),
-                            'description': item.get('description', ''),
-                            'thumbnail': '',
-                            'domain': ext.get('url', '').split('/')[2] if ext.get('url') else ''
-                        })
+                # Thumbnail is generated in the background and filled in at flush
+                self.thumbnails.submit(full_video_path)
+                video = {
+                    'src': f'/uploads/extracted/{uri}',
+                    'thumbnail': '',
+                    'url': '',
+                    'title': media['title'],
+                    'description': media['description']
+                }
+                videos.append(video)
+                self._pending_thumbnails.append((video, full_video_path))
+            else:
+                photos.append({
+                    'src': f'/uploads/extracted/{uri}',
+                    'width': 0,
+                    'height': 0,
+                    'url': '',
+                    'title': media['title']
+                })
         
-        return links if links else None
-    
+        return photos or None, videos or None
+
     def _extract_author(self, post_data):
         """Extract author information"""
         return {'name': 'You', 'id': 'self'}
     
     def import_comments(self):
         """Import comments from Facebook export"""
-        comments_file = os.path.join(self.data_directory, 'comments', 'comments.json')
+        comments_file = os.path.join('comments', 'comments.json')
         
-        if not os.path.exists(comments_file):
+        if not self.source.isfile(comments_file):
             return
         
+        start = self._resume.get('offset', 0) if self._resume.get('stage') == 'comments' else 0
         try:
-            with open(comments_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            comments = data.get('comments', []) if isinstance(data, dict) else data
-            
-            for comment_data in comments:
+            records = iter_records(self.source.open_text(comments_file),
+                                   keys=('comments',), allow_single=False)
+            for index, comment_data in enumerate(islice(records, start, None), start + 1):
+                self._advance('comments', comments_file, index)
                 self._import_single_comment(comment_data)
                 
         except Exception as e:
             self.stats['errors'].append(f"Error importing comments: {str(e)}")
+        
+        self._flush_comments()
     
     def _import_single_comment(self, comment_data):
-        """Import a single comment"""
+        """Queue a single comment; existing ones are skipped by ON CONFLICT at flush"""
+        if self.window.excludes(comment_data):
+            return
         try:
-            comment_id = comment_data.get('id') or f"import_comment_{hash(str(comment_data))}"
+            comment_id = comment_data.get('id') or "import_comment_" + hashlib.sha1(
+                json.dumps(comment_data, sort_keys=True).encode('utf-8')).hexdigest()
             
-            existing = Comment.query.filter_by(facebook_id=comment_id).first()
-            if existing:
-                return
+            self._pending_comments.append({
+                'facebook_id': comment_id,
+                'post_id': comment_data.get('post_id', ''),
+                'message': comment_data.get('comment', ''),
+                'created_time': self._extract_timestamp(comment_data),
+                'from_data': comment_data.get('author', {}),
+                'like_count': 0
+            })
             
-            new_comment = Comment(
-                facebook_id=comment_id,
-                post_id=comment_data.get('post_id', ''),
-                message=comment_data.get('comment', ''),
-                created_time=self._extract_timestamp(comment_data),
-                from_data=comment_data.get('author', {}),
-                like_count=0
-            )
-            db.session.add(new_comment)
-            self.stats['comments_imported'] += 1
-            db.session.commit()
+            if len(self._pending_comments) >= self.batch_size:
+                self._flush_comments()
             
         except Exception as e:
             self.stats['errors'].append(f"Error importing comment: {str(e)}")
-            db.session.rollback()
\ No newline at end of file
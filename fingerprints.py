@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content fingerprints for duplicate post detection
+A post is a duplicate when another post within a day of it has the same
+normalized message and the same photo and video counts
+"""
+
+import hashlib
+from datetime import datetime, timedelta
+
+
+def normalize_message(message):
+    """Remove encoding differences for comparison"""
+    if not message:
+        return ""
+    return ' '.join(message.strip().split())
+
+
+def post_fingerprint(message, photo_count, video_count, date):
+    """Hash of normalized message, media counts and YYYY-MM-DD date"""
+    key = '\x1f'.join([normalize_message(message), str(photo_count), str(video_count), date])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def window_fingerprints(message, photo_count, video_count, created_time, days=1):
+    """Fingerprints this post would have on each date within `days` of created_time"""
+    date = (created_time or '')[:10]
+    try:
+        date_obj = datetime.strptime(date, '%Y-%m-%d')
+    except ValueError:
+        return [post_fingerprint(message, photo_count, video_count, date)]
+
+    return [
+        post_fingerprint(message, photo_count, video_count,
+                         (date_obj + timedelta(days=offset)).strftime('%Y-%m-%d'))
+        for offset in range(-days, days + 1)
+    ]
+
+
+class DuplicateIndex:
+    """
+    Set of known post fingerprints, so each duplicate check is a handful of
+    hash lookups instead of a date-window query plus message comparisons
+
+    With preload=True every stored fingerprint (optionally limited to a
+    created_at range) is loaded up front, which suits imports. Otherwise
+    misses fall back to an indexed IN query, which suits small API fetches.
+    """
+
+    def __init__(self, model, preload=True, since=None, until=None):
+        self.model = model
+        self.preloaded = preload
+        self.fingerprints = set()
+
+        if preload:
+            query = model.query.with_entities(model.fingerprint).filter(model.fingerprint.isnot(None))
+            if since is not None:
+                query = query.filter(model.created_at >= since)
+            if until is not None:
+                query = query.filter(model.created_at < until)
+            self.fingerprints.update(fingerprint for (fingerprint,) in query)
+
+    def contains(self, message, photo_count, video_count, created_time):
+        """True if a matching post exists within a day of created_time"""
+        candidates = window_fingerprints(message, photo_count, video_count, created_time)
+        if any(candidate in self.fingerprints for candidate in candidates):
+            return True
+        if self.preloaded:
+            return False
+
+        match = (self.model.query
+                 .with_entities(self.model.id)
+                 .filter(self.model.fingerprint.in_(candidates))
+                 .first())
+        return match is not None
+
+    def add(self, message, photo_count, video_count, created_time):
+        """Record a post that is about to be written"""
+        self.fingerprints.add(post_fingerprint(message, photo_count, video_count, (created_time or '')[:10]))
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batched comment fetching for many posts
+Packs up to GRAPH_BATCH_SIZE /{post-id}/comments requests into one Graph
+API batch call, follows each post's comment cursors in later rounds, and
+runs the batch calls of a round on a small thread pool.
+"""
+
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from http_client import http_post
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRAPH_ROOT = 'https://graph.facebook.com'
+GRAPH_API_VERSION = 'v18.0'
+GRAPH_BATCH_SIZE = 50  # the Graph API's limit on requests per batch
+COMMENT_PAGE_SIZE = 100
+COMMENT_FIELDS = 'id,message,created_time,from,like_count'
+COMMENT_WORKERS = int(os.getenv('COMMENT_WORKERS', 4))  # batch calls in flight
+COMMENT_MAX_PAGES = int(os.getenv('COMMENT_MAX_PAGES', 0))  # per post; 0 = no limit
+COMMENT_ATTEMPTS = 3  # per page, for items the batch reports as failed or timed out
+
+
+def _comment(raw):
+    """The comment dict process_comments has always returned"""
+    return {
+        'id': raw['id'],
+        'message': raw.get('message', ''),
+        'created_time': raw['created_time'],
+        'from': raw.get('from', {}),
+        'like_count': raw.get('like_count', 0)
+    }
+
+
+class CommentFetcher:
+    """
+    Fetches every comment of many posts with Graph API batch requests
+
+    Usage:
+        comments = CommentFetcher(access_token, graph_root).fetch(post_ids)
+        comments[post_id]  # list of comment dicts, oldest page first
+
+    Each round sends the next page request of every unfinished post,
+    GRAPH_BATCH_SIZE to a call, so 100 posts with one page of comments
+    each take two calls. A post whose request keeps failing keeps the
+    comments fetched so far. graph_root replaces graph.facebook.com, e.g.
+    with a local stand-in server.
+    """
+
+    def __init__(self, access_token, graph_root=DEFAULT_GRAPH_ROOT, workers=COMMENT_WORKERS,
+                 batch_size=GRAPH_BATCH_SIZE, page_size=COMMENT_PAGE_SIZE, max_pages=COMMENT_MAX_PAGES):
+        self.access_token = access_token
+        self.graph_root = graph_root.rstrip('/')
+        self.workers = workers
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.calls = 0
+
+    def _relative_url(self, post_id, after=None):
+        params = {'fields': COMMENT_FIELDS, 'limit': self.page_size}
+        if after:
+            params['after'] = after
+        return f"{GRAPH_API_VERSION}/{post_id}/comments?{urlencode(params)}"
+
+    def _call(self, items):
+        """
+        One batch call for [(post_id, relative_url), ...]
+
+        Returns:
+            the batch response list, with None for items Facebook did not
+            answer (and for every item if the call itself failed)
+        """
+        batch = [{'method': 'GET', 'relative_url': url} for _, url in items]
+        try:
+            response = http_post(self.graph_root + '/', data={
+                'access_token': self.access_token,
+                'batch': json.dumps(batch),
+                'include_headers': 'false'
+            })
+            answers = response.json()
+        except Exception as e:
+            logger.warning("Comment batch of %d requests failed: %s", len(items), e)
+            return [None] * len(items)
+
+        if not isinstance(answers, list):
+            logger.warning("Comment batch of %d requests failed: %s", len(items),
+                           answers.get('error', answers) if isinstance(answers, dict) else answers)
+            return [None] * len(items)
+        return answers + [None] * (len(items) - len(answers))
+
+    def fetch(self, post_ids):
+        """Comments of each post, as {post_id: [comment, ...]}"""
+        results = {post_id: [] for post_id in post_ids}
+        pages = dict.fromkeys(results, 0)
+        failures = {}
+        pending = [(post_id, self._relative_url(post_id)) for post_id in results]
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='comments') as executor:
+            while pending:
+                batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+                self.calls += len(batches)
+                pending = []
+                for batch, answers in zip(batches, executor.map(self._call, batches)):
+                    for (post_id, url), answer in zip(batch, answers):
+                        next_request = self._handle(post_id, url, answer, results, pages)
+                        if next_request is None:
+                            continue
+                        if next_request[1] == url:
+                            failures[next_request] = failures.get(next_request, 0) + 1
+                            if failures[next_request] >= COMMENT_ATTEMPTS:
+                                logger.warning("Giving up on comments for post %s after %d attempts",
+                                               post_id, COMMENT_ATTEMPTS)
+                                continue
+                        pending.append(next_request)
+
+        logger.info("Fetched %d comments for %d posts in %d batch calls",
+                    sum(len(comments) for comments in results.values()), len(results), self.calls)
+        return results
+
+    def _handle(self, post_id, url, answer, results, pages):
+        """
+        Store one batch item's comments
+
+        Returns:
+            the (post_id, relative_url) to request next (the same url again
+            when the item should be retried), or None when the post is done
+        """
+        if answer is None or answer.get('code', 500) >= 500:
+            return post_id, url
+
+        try:
+            body = json.loads(answer.get('body') or '{}')
+        except ValueError:
+            return post_id, url
+        if answer['code'] != 200 or 'error' in body:
+            logger.warning("Comments for post %s unavailable: %s", post_id, body.get('error', answer['code']))
+            return None
+
+        results[post_id].extend(_comment(raw) for raw in body.get('data', []))
+        pages[post_id] += 1
+
+        paging = body.get('paging', {})
+        after = paging.get('cursors', {}).get('after')
+        if not paging.get('next') or not after:
+            return None
+        if self.max_pages and pages[post_id] >= self.max_pages:
+            logger.debug("Comment page limit reached for post %s", post_id)
+            return None
+        return post_id, self._relative_url(post_id, after)
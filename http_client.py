@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared HTTP client for Graph API and CDN requests
+One connection-pooled requests.Session with keep-alive, retries with
+exponential backoff on 429/5xx, and per-request timing
+"""
+
+import logging
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 16))  # connections kept per host
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 3))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', 0.5))  # 0.5s, 1s, 2s, ...
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 30))
+HTTP_SLOW_SECONDS = float(os.getenv('HTTP_SLOW_SECONDS', 2))  # log requests slower than this
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+stats = {'requests': 0, 'seconds': 0.0, 'slow': 0}
+
+
+def _record_timing(response, *args, **kwargs):
+    """Response hook: accumulate timing and report slow requests"""
+    seconds = response.elapsed.total_seconds()
+    with _stats_lock:
+        stats['requests'] += 1
+        stats['seconds'] += seconds
+        if seconds >= HTTP_SLOW_SECONDS:
+            stats['slow'] += 1
+
+    if seconds >= HTTP_SLOW_SECONDS:
+        # Path only: Graph URLs carry the access token in the query string
+        parts = urlsplit(response.url)
+        logger.warning("Slow request: %s %s%.60s -> %d in %.2fs", response.request.method,
+                       parts.netloc, parts.path, response.status_code, seconds)
+
+
+def _build_session():
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False  # Hand the last response back so Graph error JSON is still readable
+    )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE,
+                          max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.hooks['response'].append(_record_timing)
+    return session
+
+
+def get_session():
+    """The process-wide session, created on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def http_get(url, **kwargs):
+    """requests.get through the shared session, with a default timeout"""
+    kwargs.setdefault('timeout', HTTP_TIMEOUT)
+    return get_session().get(url, **kwargs)
+
+
+def http_post(url, **kwargs):
+    """requests.post through the shared session, with a default timeout (not retried)"""
+    kwargs.setdefault('timeout', HTTP_TIMEOUT)
+    return get_session().post(url, **kwargs)
+
+
+def timing_summary():
+    """One-line summary of requests made so far"""
+    with _stats_lock:
+        count, seconds, slow = stats['requests'], stats['seconds'], stats['slow']
+    average = seconds / count if count else 0
+    return f"{count} HTTP requests, {seconds:.1f}s total, {average * 1000:.0f}ms average, {slow} slow"
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Responsive width variants and modern encodings for stored photos
+Each photo gets smaller JPEG copies next to it (photo_w320.jpg, ...) and
+its JSON entry records them, so templates can offer a srcset and grid
+tiles load a small file instead of the full-size image. Every JPEG also
+gets WebP/AVIF siblings (photo.webp, ...) that serve_all_media picks
+from according to the browser's Accept header.
+"""
+
+import logging
+import os
+
+from PIL import Image
+from sqlalchemy.orm.attributes import flag_modified
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (320, 800, 1600)
+
+# Alternate encodings in order of preference, with their Pillow save options
+FORMAT_OPTIONS = {
+    'avif': ('AVIF', {'quality': 60}),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+}
+
+
+def _supported_formats():
+    """Configured alternate formats this Pillow build can write"""
+    registered = Image.registered_extensions()
+    wanted = [name.strip() for name in os.getenv('IMAGE_FORMATS', 'avif,webp').split(',') if name.strip()]
+    return tuple(name for name in wanted
+                 if name in FORMAT_OPTIONS and registered.get(f'.{name}') == FORMAT_OPTIONS[name][0])
+
+
+ALTERNATE_FORMATS = _supported_formats()
+
+
+def variant_path(filepath, width):
+    """photo.jpg -> photo_w320.jpg"""
+    stem, _ = os.path.splitext(filepath)
+    return f"{stem}_w{width}.jpg"
+
+
+def alternate_path(filepath, fmt):
+    """photo.jpg -> photo.webp"""
+    stem, _ = os.path.splitext(filepath)
+    return f"{stem}.{fmt}"
+
+
+def write_alternates(img, filepath, formats=None):
+    """
+    Save WebP/AVIF encodings of an opened image next to its JPEG
+
+    Returns:
+        the formats written (or already present)
+    """
+    written = []
+    for fmt in ALTERNATE_FORMATS if formats is None else formats:
+        path = alternate_path(filepath, fmt)
+        try:
+            if not os.path.exists(path):
+                pillow_format, options = FORMAT_OPTIONS[fmt]
+                img.save(path, pillow_format, **options)
+            written.append(fmt)
+        except Exception as e:
+            logger.warning("Could not write %s for %s: %s", fmt, filepath, e)
+    return written
+
+
+def write_variants(img, filepath, jpeg_quality=85, widths=VARIANT_WIDTHS):
+    """
+    Save downscaled copies of an opened RGB/L image next to filepath
+
+    Only widths smaller than the image are produced, each with its
+    alternate encodings. Existing variant files are reused.
+
+    Returns:
+        list of {'src', 'width', 'height'} dicts with web paths, narrowest first
+    """
+    variants = []
+    for width in sorted(widths):
+        if width >= img.size[0]:
+            break
+        height = max(1, round(img.size[1] * width / img.size[0]))
+        path = variant_path(filepath, width)
+        resized = None
+        if not os.path.exists(path):
+            resized = img.resize((width, height), Image.Resampling.LANCZOS)
+            resized.save(path, 'JPEG', quality=jpeg_quality, optimize=True)
+        if any(not os.path.exists(alternate_path(path, fmt)) for fmt in ALTERNATE_FORMATS):
+            write_alternates(resized or img.resize((width, height), Image.Resampling.LANCZOS), path)
+        variants.append({
+            'src': path.replace('uploads/', '/uploads/'),
+            'width': width,
+            'height': height
+        })
+    return variants
+
+
+def srcset(photo):
+    """srcset attribute value for a stored photo dict, or '' if it has no variants"""
+    variants = photo.get('variants') or []
+    if not variants:
+        return ''
+    entries = [f"{variant['src']} {variant['width']}w" for variant in variants]
+    if photo.get('width'):
+        entries.append(f"{photo['src']} {photo['width']}w")
+    return ', '.join(entries)
+
+
+def add_variants(photo, upload_folder):
+    """
+    Fill in dimensions, variants and alternate encodings for one stored
+    photo dict in place
+
+    Returns:
+        True if the dict changed
+    """
+    src = photo.get('src') or ''
+    if not src.startswith('/uploads/'):
+        return False
+    if photo.get('variants') is not None and photo.get('formats') == list(ALTERNATE_FORMATS):
+        return False
+
+    filepath = os.path.join(upload_folder, src[len('/uploads/'):])
+    try:
+        with Image.open(filepath) as img:
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            photo['width'], photo['height'] = img.size
+            photo['variants'] = write_variants(img, filepath)
+            photo['formats'] = write_alternates(img, filepath)
+        return True
+    except Exception as e:
+        logger.warning("Could not build variants for %s: %s", filepath, e)
+        return False
+
+
+def backfill_variants(model, upload_folder, batch_size=200):
+    """Generate variants and encodings for photos stored before they were produced at download time"""
+    last_id = 0
+    updated = 0
+    while True:
+        rows = (model.query
+                .filter(model.id > last_id, model.photo_count > 0)
+                .order_by(model.id)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            break
+        for row in rows:
+            photos = [dict(photo) for photo in row.photos or []]
+            if any([add_variants(photo, upload_folder) for photo in photos]):
+                row.photos = photos
+                flag_modified(row, 'photos')
+                updated += 1
+        last_id = rows[-1].id
+        db.session.commit()
+        logger.info("Variants backfilled through %s id %d (%d rows updated)",
+                    model.__tablename__, last_id, updated)
+    return updated
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PostgreSQL-backed background job queue
+Requests enqueue a Job row and return immediately; `flask worker`
+processes claim jobs with SELECT ... FOR UPDATE SKIP LOCKED and run the
+handler registered for the job's kind. Run as many workers as needed.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from models import db, Job
+
+logger = logging.getLogger(__name__)
+
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', 2))
+JOB_STALE_MINUTES = int(os.getenv('JOB_STALE_MINUTES', 30))  # running jobs without a heartbeat this long are retried
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+JOB_HEARTBEAT_SECONDS = float(os.getenv('JOB_HEARTBEAT_SECONDS', 60))  # well under JOB_STALE_MINUTES
+
+# Payload keys removed once a job finishes
+SECRET_KEYS = ('access_token',)
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """
+    Register a function as the handler for jobs of `kind`
+
+    Handlers are called as fn(payload, progress) inside the app context.
+    progress(dict) records progress; the return value is stored as the
+    job's result and must be JSON serialisable.
+    """
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _update(job_id, worker_id, engine=None, **values):
+    """
+    Write job fields on their own connection, independent of the handler's session
+
+    Only applies while worker_id still owns the running job, so a worker
+    whose job was requeued cannot overwrite the new run.
+
+    Returns:
+        True if the row was updated
+    """
+    table = Job.__table__
+    with (engine or db.engine).begin() as connection:
+        result = connection.execute(
+            table.update()
+            .where(table.c.id == job_id, table.c.worker == worker_id, table.c.status == 'running')
+            .values(**values)
+        )
+    return result.rowcount > 0
+
+
+def enqueue(kind, payload=None):
+    """Queue a job and return it; the caller's session is committed"""
+    if kind not in HANDLERS:
+        raise ValueError(f"No handler registered for job kind {kind!r}")
+    job = Job(kind=kind, status='queued', payload=payload or {}, progress={})
+    db.session.add(job)
+    db.session.commit()
+    logger.info("Queued job %d (%s)", job.id, kind)
+    return job
+
+
+def enqueue_unique(kind, payload, key):
+    """
+    Queue a job unless one of the same kind with the same payload[key] is
+    queued or running (e.g. a sync for the same user); the caller's
+    session is committed
+
+    Returns:
+        the new job, or the one already waiting or in progress
+    """
+    # Serialises concurrent requests for the same key until this transaction ends
+    db.session.execute(text('SELECT pg_advisory_xact_lock(hashtext(:lock))'),
+                       {'lock': f"{kind}:{payload[key]}"})
+    for job in Job.query.filter(Job.kind == kind, Job.status.in_(('queued', 'running'))):
+        if (job.payload or {}).get(key) == payload[key]:
+            db.session.commit()
+            logger.info("Reusing job %d (%s) for %s %s", job.id, kind, key, payload[key])
+            return job
+    return enqueue(kind, payload)
+
+
+def claim_next(worker_id):
+    """Mark the oldest queued job as running for this worker, or return None"""
+    job = (Job.query
+           .filter_by(status='queued')
+           .order_by(Job.id)
+           .with_for_update(skip_locked=True)
+           .first())
+    if job is None:
+        db.session.rollback()
+        return None
+
+    now = _now()
+    job.status = 'running'
+    job.worker = worker_id
+    job.attempts = (job.attempts or 0) + 1
+    job.started_at = now
+    job.heartbeat_at = now
+    db.session.commit()
+    return job
+
+
+def requeue_stale():
+    """Return running jobs whose worker stopped heartbeating to the queue (or fail them)"""
+    cutoff = _now() - timedelta(minutes=JOB_STALE_MINUTES)
+    stale = (Job.query
+             .filter(Job.status == 'running', Job.heartbeat_at < cutoff)
+             .with_for_update(skip_locked=True)
+             .all())
+    for job in stale:
+        if job.attempts >= JOB_MAX_ATTEMPTS:
+            job.status = 'failed'
+            job.error = f"Worker {job.worker} stopped responding after {job.attempts} attempts"
+            job.finished_at = _now()
+        else:
+            job.status = 'queued'
+        logger.warning("Job %d from worker %s went stale, now %s", job.id, job.worker, job.status)
+    db.session.commit()
+
+
+def _heartbeat(job_id, worker_id, engine, stop):
+    """Thread body: keep heartbeat_at fresh until stop is set, however long a step runs"""
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        try:
+            if not _update(job_id, worker_id, engine, heartbeat_at=_now()):
+                logger.warning("Job %d is no longer owned by %s", job_id, worker_id)
+                return
+        except Exception as e:
+            logger.warning("Heartbeat for job %d failed: %s", job_id, e)
+
+
+def run_job(job):
+    """Run a claimed job to completion, recording its result or error"""
+    job_id = job.id
+    worker_id = job.worker
+    payload = dict(job.payload or {})
+    fn = HANDLERS.get(job.kind)
+    logger.info("Running job %d (%s), attempt %d", job_id, job.kind, job.attempts)
+
+    def progress(values):
+        _update(job_id, worker_id, progress=values, heartbeat_at=_now())
+
+    # Handlers only report progress between steps; the thread covers long ones
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job_id, worker_id, db.engine, stop),
+                                 name=f'job-{job_id}-heartbeat', daemon=True)
+    heartbeat.start()
+
+    finished_payload = {key: value for key, value in payload.items() if key not in SECRET_KEYS}
+    try:
+        if fn is None:
+            raise ValueError(f"No handler registered for job kind {job.kind!r}")
+        result = fn(payload, progress)
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Job %d failed", job_id)
+        values = {'status': 'failed', 'error': str(e)}
+    else:
+        values = {'status': 'done', 'result': result}
+    finally:
+        stop.set()
+        heartbeat.join()
+
+    if _update(job_id, worker_id, payload=finished_payload, finished_at=_now(), **values):
+        logger.info("Job %d %s", job_id, values['status'])
+    else:
+        logger.warning("Job %d finished (%s) after %s lost it; result discarded",
+                       job_id, values['status'], worker_id)
+
+
+def run_worker(once=False, poll_seconds=JOB_POLL_SECONDS):
+    """
+    Claim and run jobs until interrupted (must be called inside the app context)
+
+    Args:
+        once: exit when the queue is empty instead of polling
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info("Worker %s started, handling: %s", worker_id, ', '.join(sorted(HANDLERS)))
+
+    while True:
+        requeue_stale()
+        job = claim_next(worker_id)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_seconds)
+            continue
+        run_job(job)
+        db.session.remove()  # Fresh session per job
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental JSON reader for large Facebook export files
+Yields records one at a time, so peak memory is bounded by the largest
+single record instead of the whole file
+"""
+
+import json
+import re
+
+CHUNK_SIZE = 1024 * 1024  # characters read per refill
+RECORD_KEYS = ('posts', 'status_updates', 'photos', 'videos', 'data')
+_WHITESPACE = ' \t\n\r'
+_SPACE = re.compile(r'[ \t\n\r]*')
+_NOT_STRUCTURE = bytes(sorted(set(range(256)) - set(b'"[]{}')))
+_QUOTED = re.compile(rb'"[^"]*"')
+
+
+class _StreamReader:
+    """Buffered cursor over a text file that decodes one JSON value at a time"""
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Drop consumed text and append the next chunk; False at end of file"""
+        if self.pos:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer += chunk
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it ('' at EOF)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def rest(self):
+        """The text read past the current position"""
+        return self.buffer[self.pos:]
+
+    def take(self, expected):
+        """Consume the next character, which must be one of expected"""
+        char = self.peek()
+        if not char or char not in expected:
+            raise json.JSONDecodeError(f"Expecting one of {expected!r}", self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode the complete JSON value at the current position"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Most likely the value continues past the buffered text
+                if not self._fill():
+                    raise
+                continue
+
+            # A number ending exactly at the buffer edge may continue in the next chunk
+            if end == len(self.buffer) and not self.eof:
+                self._fill()
+                continue
+
+            self.pos = end
+            return value
+
+    def array_items(self):
+        """Yield the elements of the array at the current position one by one"""
+        self.take('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.take(',]') == ']':
+                return
+
+
+def iter_records(source, keys=RECORD_KEYS, allow_single=True, chunk_size=CHUNK_SIZE):
+    """
+    Stream records from a Facebook export JSON file
+
+    Handles the layouts FacebookDataImporter has always accepted:
+    - a top-level list of records
+    - an object whose first key from `keys` holds the list (or a single record)
+    - a single record object carrying a 'timestamp' (when allow_single is set)
+
+    Unlike json.load, an object's keys are matched in file order, and only
+    the selected list is walked element by element.
+
+    `source` is a path or an open text file (e.g. a zip member); a file
+    passed in is closed once the records are exhausted.
+
+    Raises:
+        json.JSONDecodeError: if the file is not valid JSON
+    """
+    f = source if hasattr(source, 'read') else open(source, 'r', encoding='utf-8')
+    with f:
+        reader = _StreamReader(f, chunk_size)
+        first = reader.peek()
+
+        if first == '[':
+            yield from reader.array_items()
+            return
+        if first != '{':
+            reader.value()  # Scalar document (or invalid JSON): nothing to import
+            return
+
+        reader.take('{')
+        fields = {}
+        if reader.peek() == '}':
+            return
+
+        while True:
+            key = reader.value()
+            reader.take(':')
+
+            if key in keys:
+                if reader.peek() == '[':
+                    yield from reader.array_items()
+                else:
+                    yield reader.value()
+                return
+
+            fields[key] = reader.value()
+            if reader.take(',}') == '}':
+                break
+
+        # No list key found: the object itself may be one record
+        if allow_single and 'timestamp' in fields:
+            yield fields
+
+
+class _Latin1:
+    """A binary file read as latin-1, so each character of the text is exactly one byte"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def read(self, size):
+        return self.f.read(size).decode('latin-1')
+
+
+def _records_list(reader, keys):
+    """
+    Move the reader to the '[' of the list iter_records would walk
+
+    Returns:
+        False if the records are not a list (a single record, or invalid layout)
+    """
+    first = reader.peek()
+    if first == '[':
+        return True
+    if first != '{':
+        return False
+
+    reader.take('{')
+    if reader.peek() == '}':
+        return False
+    while True:
+        key = reader.value()
+        reader.take(':')
+        if key in keys:
+            return reader.peek() == '['
+        reader.value()
+        if reader.take(',}') == '}':
+            return False
+
+
+def _depth_change(data):
+    """Net bracket nesting of a run of complete lines"""
+    # With escaped backslashes and quotes gone, every quote delimits a string
+    data = data.replace(b'\\\\', b'').replace(b'\\"', b'')
+    # Keep only quotes and brackets; most strings hold no bracket and vanish as ""
+    outside = data.translate(None, _NOT_STRUCTURE).replace(b'""', b'')
+    if b'"' in outside:
+        outside = _QUOTED.sub(b'', outside)
+    return (outside.count(b'{') + outside.count(b'[')
+            - outside.count(b'}') - outside.count(b']'))
+
+
+def _record_ranges(f, head, range_bytes, chunk_size):
+    with f:
+        depth = 0  # bracket nesting inside the records list
+        parts = []
+        size = 0
+        tail = head
+        while True:
+            chunk = f.read(chunk_size)
+            data = tail + chunk
+            # JSON strings cannot hold a raw line break, so no line end is inside one
+            cut = data.rfind(b'\n') + 1 if chunk else len(data)
+            block, tail = data[:cut], data[cut:]
+
+            pos = 0
+            while pos < len(block):
+                if size < range_bytes:
+                    # Whole lines in bulk, up to the one that reaches the target size
+                    end = block.find(b'\n', pos + range_bytes - size - 1) + 1 or len(block)
+                else:
+                    # Past it, line by line until a line ends a record
+                    end = block.find(b'\n', pos) + 1 or len(block)
+                piece = block[pos:end]
+                pos = end
+                depth += _depth_change(piece)
+                parts.append(piece)
+                size += len(piece)
+                if size >= range_bytes and depth == 0 and piece.rstrip().endswith(b','):
+                    yield b''.join(parts)
+                    parts, size = [], 0
+
+            if not chunk:
+                break
+
+        if size:
+            yield b''.join(parts)
+
+
+def split_records(f, range_bytes, keys=RECORD_KEYS, chunk_size=CHUNK_SIZE):
+    """
+    Cut the records list of an export file into byte ranges of whole records
+
+    Only line breaks are scanned for cut points, counting brackets outside
+    strings, so this is far cheaper than decoding the records; each range
+    is decoded separately with range_records. A file without line breaks
+    comes back as one range.
+
+    `f` is an open binary file, closed once the ranges are exhausted. The
+    last range also holds whatever follows the list, and after the list
+    has closed later cuts are meaningless: once range_records reports the
+    close, ignore the ranges after it.
+
+    Returns:
+        an iterator of bytes, about range_bytes each, or None if the records
+        are not a list (the layouts iter_records reads without one)
+
+    Raises:
+        json.JSONDecodeError: if the text before the list is not valid JSON
+    """
+    reader = _StreamReader(_Latin1(f), chunk_size)
+    if not _records_list(reader, keys):
+        f.close()
+        return None
+    reader.take('[')
+    return _record_ranges(f, reader.rest().encode('latin-1'), range_bytes, chunk_size)
+
+
+def range_records(text):
+    """
+    Decode one split_records range
+
+    Returns:
+        (records, closed) where closed is True if the list ended in this range
+
+    Raises:
+        json.JSONDecodeError: if the range is not comma-separated JSON values
+    """
+    decoder = json.JSONDecoder()
+    records = []
+    pos = _SPACE.match(text).end()
+    while pos < len(text):
+        if text[pos] == ']':
+            return records, True
+        record, pos = decoder.raw_decode(text, pos)
+        records.append(record)
+        pos = _SPACE.match(text, pos).end()
+        if pos == len(text):
+            break
+        if text[pos] == ']':
+            return records, True
+        if text[pos] != ',':
+            raise json.JSONDecodeError("Expecting ',' or ']'", text, pos)
+        pos = _SPACE.match(text, pos + 1).end()
+    return records, False
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Logging setup shared by the web app, workers and CLI commands
+Modules log through logging.getLogger(__name__); this only decides the
+level and format. Quiet (WARNING) unless LOG_LEVEL or FLASK_DEBUG says
+otherwise; LOG_FORMAT=json emits one JSON object per line.
+"""
+
+import json
+import logging
+import os
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, for log shippers"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging(level=None, fmt=None):
+    """Install a single stderr handler on the root logger (safe to call twice)"""
+    if level is None:
+        debug = os.getenv('FLASK_DEBUG', '').lower() in ('1', 'true')
+        level = os.getenv('LOG_LEVEL', 'DEBUG' if debug else 'WARNING')
+    fmt = fmt or os.getenv('LOG_FORMAT', 'text')
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        if getattr(existing, '_timeline_handler', False):
+            root.removeHandler(existing)
+    handler._timeline_handler = True
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
@@ -13,41 +13,51 @@ Media downloader for Facebook API content
 Downloads photos and videos and stores them locally
 """
 
+import logging
 import os
-import requests
-from datetime import datetime
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 import hashlib
 from PIL import Image
 from io import BytesIO
+from http_client import http_get
+from image_variants import write_alternates, write_variants
+from media_store import content_hash, sharded_path
+
+logger = logging.getLogger(__name__)
 
 class MediaDownloader:
     """
     Downloads and processes media from Facebook API
     Supports quality selection for images
+    
+    Files are stored content-addressed (see media_store.py). With an index,
+    URLs seen before are answered from the database without downloading.
     """
     
-    def __init__(self, base_upload_dir='uploads/api'):
+    def __init__(self, base_upload_dir='uploads/api', index=None):
         self.base_upload_dir = base_upload_dir
+        self.index = index
         os.makedirs(base_upload_dir, exist_ok=True)
-        
-    def _generate_filename(self, url, media_type='photo'):
-        """Generate unique filename from URL"""
-        # Extract Facebook ID from URL if possible
-        url_hash = hashlib.md5(url.encode()).hexdigest()[:12]
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        extension = '.jpg' if media_type == 'photo' else '.mp4'
-        return f"{timestamp}_{url_hash}{extension}"
-    
-    def _create_date_folder(self, created_time):
-        """Create folder structure based on post date"""
-        # Extract date from created_time: 2023-05-08T12:36:14+0000
-        date_str = created_time[:10]  # Gets YYYY-MM-DD
-        year_month = date_str[:7]  # Gets YYYY-MM
-        
-        folder_path = os.path.join(self.base_upload_dir, year_month, date_str)
-        os.makedirs(folder_path, exist_ok=True)
-        return folder_path
+    
+    def _known(self, url, variant):
+        """Stored info for a URL downloaded before whose file is still on disk"""
+        if self.index is None:
+            return None
+        info = self.index.lookup_url(url, variant)
+        if info and os.path.isfile(info['src'].replace('/uploads/', 'uploads/', 1)):
+            logger.debug("Already stored, skipping download: %.50s...", url)
+            return dict(info, url=url)
+        return None
+    
+    def _remember(self, url, digest, variant, info):
+        if self.index is not None:
+            self.index.record(url, digest, variant, info)
+    
+    def _temp_path(self):
+        return os.path.join(self.base_upload_dir, f".tmp-{uuid.uuid4().hex}")
     
     def download_photo(self, photo_url, created_time, quality='high'):
         """
@@ -55,18 +65,29 @@ class MediaDownloader:
         
         Args:
             photo_url: URL to the photo
-            created_time: Post creation time for folder organization
+            created_time: Post creation time (kept for callers; storage is by content)
             quality: 'low', 'medium', or 'high'
         
         Returns:
             dict with local file info or None if failed
         """
         try:
-            print(f"      Downloading photo: {photo_url[:50]}...")
+            known = self._known(photo_url, quality)
+            if known:
+                return known
+            
+            logger.debug("Downloading photo: %.50s...", photo_url)
             
             # Download image
-            response = requests.get(photo_url, timeout=30)
+            response = http_get(photo_url, timeout=30)
             response.raise_for_status()
+            digest = content_hash(response.content)
+            
+            # Same bytes from another URL or post: reuse the stored rendition
+            stored = self.index.lookup_content(digest, quality) if self.index else None
+            if stored and os.path.isfile(stored['src'].replace('/uploads/', 'uploads/', 1)):
+                self._remember(photo_url, digest, quality, stored)
+                return dict(stored, url=photo_url)
             
             # Open image with PIL
             img = Image.open(BytesIO(response.content))
@@ -91,7 +112,7 @@ class MediaDownloader:
                 ratio = max_size / max(img.size)
                 new_size = tuple(int(dim * ratio) for dim in img.size)
                 img = img.resize(new_size, Image.Resampling.LANCZOS)
-                print(f"        Resized from {original_width}x{original_height} to {img.size[0]}x{img.size[1]}")
+                logger.debug("Resized from %dx%d to %dx%d", original_width, original_height, img.size[0], img.size[1])
             
             # Convert RGBA to RGB if necessary
             if img.mode == 'RGBA':
@@ -101,30 +122,66 @@ class MediaDownloader:
             elif img.mode not in ('RGB', 'L'):
                 img = img.convert('RGB')
             
-            # Save to disk
-            folder_path = self._create_date_folder(created_time)
-            filename = self._generate_filename(photo_url, 'photo')
-            filepath = os.path.join(folder_path, filename)
-            
-            img.save(filepath, 'JPEG', quality=jpeg_quality, optimize=True)
+            # Save to disk under the content hash; rename so readers never see a partial file
+            filepath = sharded_path(self.base_upload_dir, digest, f"_{quality}.jpg")
+            if not os.path.exists(filepath):
+                temp_path = self._temp_path()
+                img.save(temp_path, 'JPEG', quality=jpeg_quality, optimize=True)
+                os.replace(temp_path, filepath)
             file_size = os.path.getsize(filepath)
             
-            print(f"        ✅ Saved: {filepath} ({file_size // 1024}KB)")
+            # Smaller copies for srcset, so grid tiles don't load the full image,
+            # plus WebP/AVIF encodings that are served when the browser accepts them
+            variants = write_variants(img, filepath, jpeg_quality)
+            formats = write_alternates(img, filepath)
+            
+            logger.debug("Saved: %s (%dKB)", filepath, file_size // 1024)
             
             # Return relative path from uploads directory
             relative_path = filepath.replace('uploads/', '/uploads/')
             
-            return {
+            info = {
                 'src': relative_path,
                 'width': img.size[0],
                 'height': img.size[1],
                 'url': photo_url,
                 'title': '',
-                'file_size': file_size
+                'file_size': file_size,
+                'variants': variants,
+                'formats': formats
             }
+            self._remember(photo_url, digest, quality, info)
+            return info
+            
+        except Exception as e:
+            logger.warning("Failed to download photo %.50s: %s", photo_url, e)
+            return None
+    
+    def _download_thumbnail(self, thumbnail_url):
+        """Store a video poster image by content; web path or None"""
+        try:
+            known = self._known(thumbnail_url, 'thumb')
+            if known:
+                return known['src']
+            
+            thumb_response = http_get(thumbnail_url, timeout=30)
+            thumb_response.raise_for_status()
+            digest = content_hash(thumb_response.content)
+            
+            thumb_filepath = sharded_path(self.base_upload_dir, digest, '_thumb.jpg')
+            if not os.path.exists(thumb_filepath):
+                temp_path = self._temp_path()
+                with open(temp_path, 'wb') as f:
+                    f.write(thumb_response.content)
+                os.replace(temp_path, thumb_filepath)
+            
+            thumbnail_path = thumb_filepath.replace('uploads/', '/uploads/')
+            self._remember(thumbnail_url, digest, 'thumb', {'src': thumbnail_path})
+            logger.debug("Saved thumbnail: %s", thumb_filepath)
+            return thumbnail_path
             
         except Exception as e:
-            print(f"        ❌ Failed to download photo: {e}")
+            logger.warning("Failed to download thumbnail: %s", e)
             return None
     
     def download_video(self, video_url, created_time, thumbnail_url=None):
@@ -133,55 +190,50 @@ class MediaDownloader:
         
         Args:
             video_url: URL to the video
-            created_time: Post creation time for folder organization
+            created_time: Post creation time (kept for callers; storage is by content)
             thumbnail_url: Optional thumbnail URL
         
         Returns:
             dict with local file info or None if failed
         """
+        temp_path = None
         try:
-            print(f"      Downloading video: {video_url[:50]}...")
+            known = self._known(video_url, 'video')
+            if known:
+                return known
+            
+            logger.debug("Downloading video: %.50s...", video_url)
             
             # Download video
-            response = requests.get(video_url, timeout=60, stream=True)
+            response = http_get(video_url, timeout=60, stream=True)
             response.raise_for_status()
             
-            # Save video
-            folder_path = self._create_date_folder(created_time)
-            filename = self._generate_filename(video_url, 'video')
-            filepath = os.path.join(folder_path, filename)
-            
-            # Stream download for large files
-            with open(filepath, 'wb') as f:
+            # Stream download for large files, hashing as we go
+            temp_path = self._temp_path()
+            hasher = hashlib.sha256()
+            with open(temp_path, 'wb') as f:
                 for chunk in response.iter_content(chunk_size=8192):
+                    hasher.update(chunk)
                     f.write(chunk)
+            digest = hasher.hexdigest()
+            
+            filepath = sharded_path(self.base_upload_dir, digest, '.mp4')
+            if os.path.exists(filepath):
+                os.remove(temp_path)
+            else:
+                os.replace(temp_path, filepath)
+            temp_path = None
             
             file_size = os.path.getsize(filepath)
-            print(f"        ✅ Saved video: {filepath} ({file_size // (1024*1024)}MB)")
+            logger.debug("Saved video: %s (%dMB)", filepath, file_size // (1024*1024))
             
             # Download thumbnail if provided
-            thumbnail_path = None
-            if thumbnail_url:
-                try:
-                    thumb_response = requests.get(thumbnail_url, timeout=30)
-                    thumb_response.raise_for_status()
-                    
-                    thumb_filename = self._generate_filename(thumbnail_url + '_thumb', 'photo')
-                    thumb_filepath = os.path.join(folder_path, thumb_filename)
-                    
-                    with open(thumb_filepath, 'wb') as f:
-                        f.write(thumb_response.content)
-                    
-                    thumbnail_path = thumb_filepath.replace('uploads/', '/uploads/')
-                    print(f"        ✅ Saved thumbnail: {thumb_filepath}")
-                    
-                except Exception as e:
-                    print(f"        ⚠️ Failed to download thumbnail: {e}")
+            thumbnail_path = self._download_thumbnail(thumbnail_url) if thumbnail_url else None
             
             # Return relative path from uploads directory
             relative_path = filepath.replace('uploads/', '/uploads/')
             
-            return {
+            info = {
                 'src': relative_path,
                 'thumbnail': thumbnail_path or '',
                 'url': video_url,
@@ -189,10 +241,15 @@ class MediaDownloader:
                 'description': '',
                 'file_size': file_size
             }
+            self._remember(video_url, digest, 'video', info)
+            return info
             
         except Exception as e:
-            print(f"        ❌ Failed to download video: {e}")
+            logger.warning("Failed to download video %.50s: %s", video_url, e)
             return None
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
     
     def get_storage_stats(self):
         """Get statistics about stored media"""
@@ -208,4 +265,56 @@ class MediaDownloader:
         return {
             'total_size_mb': total_size / (1024 * 1024),
             'file_count': file_count
-        }
\ No newline at end of file
+        }
+
+
+class DownloadPool:
+    """
+    Runs MediaDownloader downloads concurrently
+
+    At most max_workers downloads run at once, and at most per_host of them
+    against any single host, so a large album does not hammer one CDN node.
+    Each call returns a Future; callers keep the futures in attachment order
+    and read the results in that order.
+    """
+    
+    def __init__(self, downloader, max_workers=8, per_host=4):
+        self.downloader = downloader
+        self.per_host = per_host
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='download')
+        self._host_limits = {}
+        self._lock = threading.Lock()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+    
+    def _host_limit(self, url):
+        """Semaphore shared by every download from url's host"""
+        host = urlsplit(url).hostname or ''
+        with self._lock:
+            limit = self._host_limits.get(host)
+            if limit is None:
+                limit = threading.BoundedSemaphore(self.per_host)
+                self._host_limits[host] = limit
+            return limit
+    
+    def _run(self, url, download, *args):
+        with self._host_limit(url):
+            return download(url, *args)
+    
+    def photo(self, photo_url, created_time, quality='high'):
+        """Queue download_photo; the future resolves to its dict or None"""
+        return self._executor.submit(self._run, photo_url, self.downloader.download_photo,
+                                     created_time, quality)
+    
+    def video(self, video_url, created_time, thumbnail_url=None):
+        """Queue download_video; the future resolves to its dict or None"""
+        return self._executor.submit(self._run, video_url, self.downloader.download_video,
+                                     created_time, thumbnail_url)
+    
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed media storage
+Files are named by the sha256 of the downloaded bytes and sharded into
+two levels of directories (ab/cd/abcd....jpg), so the same image shared
+in several posts or fetched again on a later sync is stored once. The
+media_object and media_url tables remember what was stored and which
+source URLs produced it, so known URLs are not downloaded again.
+"""
+
+import hashlib
+import logging
+import os
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import MediaObject, MediaUrl
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# Per-fetch signature and cache parameters on Facebook CDN URLs
+CDN_DOMAIN = '.fbcdn.net'
+SIGNATURE_PARAMS = ('oh', 'oe')
+SIGNATURE_PREFIXES = ('_nc_',)
+
+
+def _is_signature_param(name):
+    return name in SIGNATURE_PARAMS or name.startswith(SIGNATURE_PREFIXES)
+
+
+def url_hash(url):
+    """
+    Hash of the URL without its short-lived signature parameters
+
+    Only Facebook CDN URLs (scontent-*.fbcdn.net photos, video-*.fbcdn.net
+    videos) are trimmed, of oh/oe/_nc_* values and of the edge node host,
+    which differs between fetches of the same file; everything else (e.g.
+    stp= picking the size, or the url= that safe_image.php and Graph
+    /picture URLs are identified by) stays in the key.
+    """
+    parts = urlsplit(url)
+    netloc, query = parts.netloc, parts.query
+    if parts.hostname and parts.hostname.endswith(CDN_DOMAIN):
+        netloc = CDN_DOMAIN
+        query = urlencode([(name, value) for name, value in parse_qsl(query, keep_blank_values=True)
+                           if not _is_signature_param(name)])
+    stable = urlunsplit((parts.scheme, netloc, parts.path, query, ''))
+    return hashlib.sha256(stable.encode('utf-8')).hexdigest()
+
+
+def sharded_path(base_dir, digest, suffix):
+    """base_dir/ab/cd/<digest><suffix>, creating the directories"""
+    folder = os.path.join(base_dir, digest[:2], digest[2:4])
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{digest}{suffix}")
+
+
+class MediaIndex:
+    """
+    Database index of stored media
+
+    Holds an engine rather than using the Flask-SQLAlchemy session, so the
+    DownloadPool threads (which have no app context) can share it.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def lookup_url(self, url, variant):
+        """Stored info for a URL we have downloaded before, or None"""
+        statement = (
+            select(MediaObject.info)
+            .join(MediaUrl, (MediaUrl.content_hash == MediaObject.content_hash) &
+                  (MediaUrl.variant == MediaObject.variant))
+            .where(MediaUrl.url_hash == url_hash(url), MediaUrl.variant == variant)
+        )
+        with self.engine.connect() as connection:
+            return connection.execute(statement).scalar()
+
+    def lookup_content(self, digest, variant):
+        """Stored info for content we already hold, or None"""
+        statement = select(MediaObject.info).where(
+            MediaObject.content_hash == digest, MediaObject.variant == variant)
+        with self.engine.connect() as connection:
+            return connection.execute(statement).scalar()
+
+    def record(self, url, digest, variant, info):
+        """Remember the stored file and that url produced it"""
+        with self.engine.begin() as connection:
+            connection.execute(
+                pg_insert(MediaObject.__table__)
+                .values(content_hash=digest, variant=variant, info=info)
+                .on_conflict_do_nothing(index_elements=['content_hash', 'variant'])
+            )
+            if url:
+                connection.execute(
+                    pg_insert(MediaUrl.__table__)
+                    .values(url_hash=url_hash(url), variant=variant, content_hash=digest)
+                    .on_conflict_do_update(index_elements=['url_hash', 'variant'],
+                                           set_={'content_hash': digest})
+                )
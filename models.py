@@ -6,12 +6,292 @@ Created on Tue Sep 30 22:36:54 2025
 @author: traedennord
 """
 
+import os
+from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy import Float, bindparam, cast, event, func, inspect, text
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import JSON, TSVECTOR, insert as pg_insert
+from fingerprints import post_fingerprint
 
 db = SQLAlchemy()
 
-class Post(db.Model):
+# Text search configuration used for stemming, e.g. 'english', 'german', 'simple'
+SEARCH_LANGUAGE = os.getenv('SEARCH_LANGUAGE', 'english')
+
+
+def _list_length(value):
+    """Length of a JSON media list, treating null/non-list values as empty"""
+    return len(value) if isinstance(value, list) else 0
+
+
+def timeline_order_columns():
+    """
+    Index expressions matching the timeline's ORDER BY created_at DESC NULLS
+    LAST, id DESC, so pages are read with a forward index scan
+    """
+    return text('created_at DESC NULLS LAST'), text('id DESC')
+
+
+def _json_length_sql(column):
+    """SQL equivalent of _list_length for a JSON column"""
+    return (f"CASE WHEN json_typeof({column}) = 'array' "
+            f"THEN json_array_length({column}) ELSE 0 END")
+
+
+class MediaCountsMixin:
+    """
+    Keeps photo/video/link counts alongside the JSON media lists so the
+    timeline's has_photo/has_video/has_links filters can run in SQL
+    """
+    photo_count = db.Column(db.Integer, default=0)
+    video_count = db.Column(db.Integer, default=0)
+    link_count = db.Column(db.Integer, default=0)
+
+    def refresh_media_counts(self):
+        self.photo_count = _list_length(self.photos)
+        self.video_count = _list_length(self.videos)
+        self.link_count = _list_length(self.links)
+
+    @classmethod
+    def media_count_indexes(cls, table_name):
+        """Partial timeline-order indexes so filtered pages stay index scans"""
+        return tuple(
+            db.Index(f'ix_{table_name}_with_{field}', *timeline_order_columns(),
+                     postgresql_where=text(f'{field}_count > 0'))
+            for field in ('photo', 'video', 'link')
+        )
+
+    @classmethod
+    def backfill_media_counts(cls):
+        """Populate counts for rows written before the columns existed"""
+        table = cls.__table__.name
+        db.session.execute(text(
+            f'UPDATE "{table}" SET '
+            f'photo_count = {_json_length_sql("photos")}, '
+            f'video_count = {_json_length_sql("videos")}, '
+            f'link_count = {_json_length_sql("links")} '
+            f'WHERE photo_count IS NULL OR video_count IS NULL OR link_count IS NULL'
+        ))
+        db.session.commit()
+
+
+@event.listens_for(MediaCountsMixin, 'before_insert', propagate=True)
+@event.listens_for(MediaCountsMixin, 'before_update', propagate=True)
+def _sync_media_counts(mapper, connection, target):
+    target.refresh_media_counts()
+
+
+def parse_created_time(value):
+    """Parse a Graph API/export timestamp like 2023-05-08T12:36:14+0000, or None"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z')
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else None
+
+
+class CreatedAtMixin:
+    """
+    Native timestamptz copy of the created_time string, used for ordering
+    and date-range filters so they can use a btree range scan
+    """
+    created_at = db.Column(db.DateTime(timezone=True))
+
+    @classmethod
+    def backfill_created_at(cls, batch_size=1000):
+        """
+        Parse created_at in Python for rows written before it existed
+
+        Uses parse_created_time, like the insert paths, so a malformed
+        created_time leaves that row NULL instead of failing the upgrade.
+        """
+        table = cls.__table__
+        statement = (
+            table.update()
+            .where(table.c.id == bindparam('row_id'))
+            .values(created_at=bindparam('row_created_at'))
+        )
+        last_id = 0
+        while True:
+            # Walk by id: rows that stay NULL must not be selected again
+            rows = (db.session.query(cls.id, cls.created_time)
+                    .filter(cls.created_at.is_(None), cls.id > last_id)
+                    .order_by(cls.id)
+                    .limit(batch_size)
+                    .all())
+            if not rows:
+                break
+            last_id = rows[-1].id
+            updates = [{'row_id': row.id, 'row_created_at': parse_created_time(row.created_time)}
+                       for row in rows]
+            updates = [update for update in updates if update['row_created_at'] is not None]
+            if updates:
+                db.session.execute(statement, updates)
+            db.session.commit()
+
+
+@event.listens_for(CreatedAtMixin, 'before_insert', propagate=True)
+@event.listens_for(CreatedAtMixin, 'before_update', propagate=True)
+def _sync_created_at(mapper, connection, target):
+    target.created_at = parse_created_time(target.created_time)
+
+
+class SearchableMixin:
+    """
+    Maintains a tsvector over message for ranked full-text keyword search,
+    with a trigram index on message for substring matching
+    """
+    search_vector = db.Column(TSVECTOR)
+
+    @classmethod
+    def search_indexes(cls, table_name):
+        return (
+            db.Index(f'ix_{table_name}_search_vector', 'search_vector',
+                     postgresql_using='gin'),
+            db.Index(f'ix_{table_name}_message_trgm', 'message',
+                     postgresql_using='gin',
+                     postgresql_ops={'message': 'gin_trgm_ops'}),
+        )
+
+    @classmethod
+    def fulltext_match(cls, keyword):
+        """
+        Return (filter condition, rank expression) for a web-style search string
+
+        ts_rank_cd returns a float4; the rank is cast to double precision so
+        it orders and compares exactly like the Python float a page cursor
+        stores (a real would be widened to 0.10000000149 against 0.1).
+        """
+        query = func.websearch_to_tsquery(SEARCH_LANGUAGE, keyword)
+        rank = cast(func.ts_rank_cd(cls.search_vector, query), Float(precision=53))
+        return cls.search_vector.op('@@')(query), rank
+
+    @classmethod
+    def backfill_search_vector(cls):
+        """Populate search_vector for rows written before the column existed"""
+        table = cls.__table__.name
+        db.session.execute(text(
+            f'UPDATE "{table}" SET search_vector = '
+            f"to_tsvector(:language, coalesce(message, '')) "
+            f'WHERE search_vector IS NULL'
+        ), {'language': SEARCH_LANGUAGE})
+        db.session.commit()
+
+
+@event.listens_for(SearchableMixin, 'before_insert', propagate=True)
+@event.listens_for(SearchableMixin, 'before_update', propagate=True)
+def _sync_search_vector(mapper, connection, target):
+    target.search_vector = func.to_tsvector(SEARCH_LANGUAGE, func.coalesce(target.message, ''))
+
+
+class FingerprintMixin:
+    """
+    Persists the duplicate-detection fingerprint (see fingerprints.py) so
+    existing posts can be matched by index lookup instead of rescanning
+    """
+    fingerprint = db.Column(db.String(40), index=True)
+
+    @staticmethod
+    def fingerprint_for(message, photos, videos, created_time):
+        return post_fingerprint(message, _list_length(photos), _list_length(videos),
+                                (created_time or '')[:10])
+
+    def refresh_fingerprint(self):
+        self.fingerprint = self.fingerprint_for(self.message, self.photos, self.videos, self.created_time)
+
+    @classmethod
+    def backfill_fingerprints(cls, batch_size=1000):
+        """Compute fingerprints in Python for rows written before the column existed"""
+        table = cls.__table__
+        statement = (
+            table.update()
+            .where(table.c.id == bindparam('row_id'))
+            .values(fingerprint=bindparam('row_fingerprint'))
+        )
+        while True:
+            rows = (db.session.query(cls.id, cls.message, cls.photos, cls.videos, cls.created_time)
+                    .filter(cls.fingerprint.is_(None))
+                    .limit(batch_size)
+                    .all())
+            if not rows:
+                break
+            db.session.execute(statement, [
+                {'row_id': row.id,
+                 'row_fingerprint': cls.fingerprint_for(row.message, row.photos, row.videos, row.created_time)}
+                for row in rows
+            ])
+            db.session.commit()
+
+
+@event.listens_for(FingerprintMixin, 'before_insert', propagate=True)
+@event.listens_for(FingerprintMixin, 'before_update', propagate=True)
+def _sync_fingerprint(mapper, connection, target):
+    target.refresh_fingerprint()
+
+
+class CacheVersionMixin:
+    """
+    Gives the table a version number that moves after every commit that
+    writes its rows, so caches of rendered pages can tell they are stale,
+    including when the write happened in another process
+
+    The version is a PostgreSQL sequence: readers see it via last_value
+    and writers bump it with nextval after their transaction commits.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Standalone sequence, created by create_all
+        db.Sequence(cls.cache_sequence_name(), metadata=db.metadata)
+
+    @classmethod
+    def cache_sequence_name(cls):
+        return f'{cls.__tablename__}_cache_seq'
+
+    @classmethod
+    def cache_version(cls):
+        """Current version; changes whenever committed rows change"""
+        return db.session.execute(text(f'SELECT last_value FROM {cls.cache_sequence_name()}')).scalar()
+
+    @classmethod
+    def bump_cache_version(cls):
+        """Move the version on (nextval is not transactional, so no lock is held)"""
+        with db.engine.connect() as connection:
+            connection.execute(text(f"SELECT nextval('{cls.cache_sequence_name()}')"))
+            connection.commit()
+
+    @classmethod
+    def mark_changed(cls, session):
+        """Bump the version once the session's current transaction commits"""
+        session.info.setdefault('changed_cache_models', set()).add(cls)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_cache_changes(session, flush_context):
+    for target in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(target, CacheVersionMixin):
+            type(target).mark_changed(session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_cache_versions(session):
+    for model in session.info.pop('changed_cache_models', ()):
+        model.bump_cache_version()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_cache_changes(session, previous_transaction):
+    session.info.pop('changed_cache_models', None)
+
+
+class Post(CreatedAtMixin, MediaCountsMixin, SearchableMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     facebook_id = db.Column(db.String(100), unique=True)
     message = db.Column(db.Text)
@@ -23,6 +303,11 @@ class Post(db.Model):
     comments = db.Column(JSON, nullable=True)
     source = db.Column(db.String(20), default='api')  # NEW: 'api' or 'import'
 
+    # Keyset pagination and date ranges walk (created_at, id)
+    __table_args__ = (
+        db.Index('ix_post_created_at_id', *timeline_order_columns()),
+    ) + MediaCountsMixin.media_count_indexes('post') + SearchableMixin.search_indexes('post')
+
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     facebook_id = db.Column(db.String(100), unique=True)
@@ -30,4 +315,229 @@ class Comment(db.Model):
     message = db.Column(db.Text)
     created_time = db.Column(db.String(50))
     from_data = db.Column(JSON, nullable=True)
-    like_count = db.Column(db.Integer, default=0)
\ No newline at end of file
+    like_count = db.Column(db.Integer, default=0)
+
+class SyncState(db.Model):
+    """
+    Per-user high-water mark for /me/posts syncs, one row per target table
+
+    newest_created_time is the latest post seen by the last sync that walked
+    every page; the next sync only asks the Graph API for newer posts.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(100), nullable=False)
+    feed = db.Column(db.String(50), nullable=False)  # 'post' or 'timeline_data'
+    newest_created_time = db.Column(db.String(50))
+    updated_at = db.Column(db.DateTime(timezone=True))
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'feed', name='uq_sync_state_user_feed'),
+    )
+
+class MediaObject(db.Model):
+    """
+    One stored media file, addressed by the sha256 of the downloaded bytes
+
+    variant separates renditions of the same source bytes (photo quality
+    tier, 'video', 'thumb'); info is the dict download_photo/download_video
+    returned, reused verbatim when the same content turns up again.
+    """
+    __tablename__ = 'media_object'
+
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    variant = db.Column(db.String(20), nullable=False)
+    info = db.Column(JSON, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        db.UniqueConstraint('content_hash', 'variant', name='uq_media_object_content_variant'),
+    )
+
+class MediaUrl(db.Model):
+    """Source URL (signature parameters dropped, hashed; see url_hash) -> content it was last seen to hold"""
+    __tablename__ = 'media_url'
+
+    url_hash = db.Column(db.String(64), primary_key=True)
+    variant = db.Column(db.String(20), primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+
+class Job(db.Model):
+    """
+    Background job queued by a request and run by a `flask worker` process
+
+    Workers claim queued rows with FOR UPDATE SKIP LOCKED, so any number of
+    them can poll the same table. See jobs.py.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # key into jobs.HANDLERS
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    payload = db.Column(JSON, nullable=True)
+    progress = db.Column(JSON, nullable=True)
+    result = db.Column(JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+    started_at = db.Column(db.DateTime(timezone=True))
+    heartbeat_at = db.Column(db.DateTime(timezone=True))
+    finished_at = db.Column(db.DateTime(timezone=True))
+
+    # Workers poll for the oldest queued job
+    __table_args__ = (
+        db.Index('ix_job_status_id', 'status', 'id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress or {},
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class ImportCheckpoint(db.Model):
+    """
+    How far an unfinished export import got, saved after every committed batch
+
+    import_key identifies the export (archive name and size), so a retried
+    job or a re-upload of the same archive resumes instead of starting over.
+    position holds the stage, the finished files and the number of records
+    consumed from the current one. The row is deleted when the import ends.
+    """
+    __tablename__ = 'import_checkpoint'
+
+    import_key = db.Column(db.String(300), primary_key=True)
+    position = db.Column(JSON, nullable=False)
+    stats = db.Column(JSON, nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+
+
+def bulk_insert_ignore(model, rows, conflict_column='facebook_id'):
+    """
+    Insert plain row dicts in one INSERT ... ON CONFLICT DO NOTHING statement
+
+    Core inserts skip the ORM listeners, so the derived columns they would
+    maintain (media counts, created_at, search_vector) are filled here.
+    Rows must all carry the same keys. Does not commit; cache versions
+    move when the caller does.
+
+    Returns:
+        ids of the rows actually inserted (conflicting rows are left out)
+    """
+    if not rows:
+        return []
+
+    table = model.__table__
+    prepared = []
+    for row in rows:
+        row = dict(row)
+        if issubclass(model, MediaCountsMixin):
+            row['photo_count'] = _list_length(row.get('photos'))
+            row['video_count'] = _list_length(row.get('videos'))
+            row['link_count'] = _list_length(row.get('links'))
+        if issubclass(model, CreatedAtMixin):
+            row['created_at'] = parse_created_time(row.get('created_time'))
+        if issubclass(model, FingerprintMixin):
+            row['fingerprint'] = model.fingerprint_for(
+                row.get('message'), row.get('photos'), row.get('videos'), row.get('created_time'))
+        if issubclass(model, SearchableMixin):
+            # Computed in the INSERT itself, so each row is written (and GIN-indexed) once
+            row['search_vector'] = func.to_tsvector(SEARCH_LANGUAGE, func.coalesce(row.get('message'), ''))
+        prepared.append(row)
+
+    statement = (
+        pg_insert(table)
+        .values(prepared)
+        .on_conflict_do_nothing(index_elements=[conflict_column])
+        .returning(table.c.id)
+    )
+    inserted_ids = [row_id for (row_id,) in db.session.execute(statement)]
+
+    if inserted_ids and issubclass(model, CacheVersionMixin):
+        model.mark_changed(db.session)
+
+    return inserted_ids
+
+
+def bulk_upsert(model, rows, update_columns, conflict_column='facebook_id'):
+    """
+    Write plain row dicts in one INSERT ... ON CONFLICT DO UPDATE statement
+
+    Rows that already exist get update_columns refreshed from the new
+    values. Meant for tables without derived columns (e.g. Comment); rows
+    repeating a key are collapsed to the last one, since Postgres rejects
+    a statement that updates the same row twice. Does not commit.
+
+    Returns:
+        number of rows inserted or updated
+    """
+    unique_rows = list({row[conflict_column]: row for row in rows}.values())
+    if not unique_rows:
+        return 0
+
+    table = model.__table__
+    statement = pg_insert(table).values(unique_rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[conflict_column],
+        set_={column: statement.excluded[column] for column in update_columns}
+    )
+    written = db.session.execute(statement).rowcount
+
+    if written and issubclass(model, CacheVersionMixin):
+        model.mark_changed(db.session)
+    return written
+
+
+def add_missing_columns():
+    """Add columns declared on models to tables created before they existed"""
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                db.session.execute(text(
+                    f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                ))
+    db.session.commit()
+
+
+def ensure_indexes():
+    """Create declared indexes on tables that predate them (create_all skips existing tables)"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
+def enable_extensions():
+    """Enable pg_trgm, which the message substring indexes depend on"""
+    db.session.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    db.session.commit()
+
+
+def upgrade_schema():
+    """Bring an existing database up to the current models, then build indexes"""
+    enable_extensions()
+    db.create_all()
+    add_missing_columns()
+    for model in MediaCountsMixin.__subclasses__():
+        model.backfill_media_counts()
+    for model in CreatedAtMixin.__subclasses__():
+        model.backfill_created_at()
+    for model in SearchableMixin.__subclasses__():
+        model.backfill_search_vector()
+    for model in FingerprintMixin.__subclasses__():
+        model.backfill_fingerprints()
+    ensure_indexes()
+    # Backfills write with plain UPDATEs, so move cache versions explicitly
+    for model in CacheVersionMixin.__subclasses__():
+        model.bump_cache_version()
@@ -12,10 +12,11 @@ Created on Sat Oct  4 22:15:48 2025
 New timeline data model with local media storage
 """
 
-from models import db  # Import the EXISTING db from models.py
+from models import db, CacheVersionMixin, CreatedAtMixin, FingerprintMixin, MediaCountsMixin, SearchableMixin, timeline_order_columns  # Import the EXISTING db from models.py
 from sqlalchemy.dialects.postgresql import JSON
 
-class TimelineData(db.Model):
+class TimelineData(CreatedAtMixin, MediaCountsMixin, SearchableMixin, FingerprintMixin, CacheVersionMixin,
+                   db.Model):
     """
     New timeline model that stores media files locally instead of URLs
     """
@@ -37,5 +38,10 @@ class TimelineData(db.Model):
     source = db.Column(db.String(20), default='api_v2')
     media_quality = db.Column(db.String(20), default='high')
     
+    # Keyset pagination and date ranges walk (created_at, id)
+    __table_args__ = (
+        db.Index('ix_timeline_data_created_at_id', *timeline_order_columns()),
+    ) + MediaCountsMixin.media_count_indexes('timeline_data') + SearchableMixin.search_indexes('timeline_data')
+    
     def __repr__(self):
         return f'<TimelineData {self.facebook_id}>'
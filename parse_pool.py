@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parallel parsing of export post files
+JSON decoding and post normalisation are CPU bound and hold the GIL, so
+they run in worker processes while FacebookDataImporter stays the single
+writer that batches the inserts. Files up to split_bytes are parsed whole
+by one worker; larger ones are cut by the parent at record boundaries
+(a bracket count, not a decode) and each byte range is decoded by a
+worker, so one huge file still spreads across every core.
+"""
+
+import logging
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+
+from export_posts import normalize_post
+from export_source import open_source
+from json_stream import iter_records, range_records, split_records
+
+logger = logging.getLogger(__name__)
+
+SPLIT_BYTES = int(os.getenv('IMPORT_SPLIT_MB', 32)) * 1024 * 1024
+RANGE_BYTES = int(os.getenv('IMPORT_RANGE_MB', 8)) * 1024 * 1024
+
+# Sources opened by this worker process, keyed by spec
+_sources = {}
+
+
+def _worker_source(spec):
+    source = _sources.get(spec)
+    if source is None:
+        source = _sources[spec] = open_source(spec)
+    return source
+
+
+def _normalize(post_data, window):
+    """normalize_post, with a failure reported as {'error': ...} so it only loses its own record"""
+    try:
+        return normalize_post(post_data, window)
+    except Exception as e:
+        return {'error': str(e)}
+
+
+def _parse_file(spec, path, start, window):
+    """Worker task: every normalised post in one file from record `start`"""
+    records = iter_records(_worker_source(spec).open_text(path))
+    return [_normalize(post_data, window) for post_data in islice(records, start, None)]
+
+
+def _parse_range(data, window):
+    """Worker task: every normalised post in one byte range of a large file"""
+    records, closed = range_records(data.decode('utf-8'))
+    return [_normalize(post_data, window) for post_data in records], closed
+
+
+def _failed(exc):
+    future = Future()
+    future.set_exception(exc)
+    return future
+
+
+class _SplitFile:
+    """What the ranges of one split file taken so far tell the next one"""
+
+    def __init__(self, skip):
+        self.skip = skip  # records still to skip when resuming
+        self.closed = False  # the records list has ended
+
+
+class _RangeResult:
+    """
+    The posts of one range task, trimmed by the ranges before it
+
+    Stands in for the task's future; results() callers take results in
+    order, which is what lets each range learn from the one before.
+    """
+
+    def __init__(self, future, split):
+        self.future = future
+        self.split = split
+
+    def result(self):
+        if self.split.closed:
+            # Cut after the list ended, so not records
+            self.future.cancel()
+            return []
+        try:
+            posts, self.split.closed = self.future.result()
+        except Exception:
+            # Like a decode error in a whole file, this ends the file
+            self.split.closed = True
+            raise
+        kept = posts[self.split.skip:]
+        self.split.skip -= len(posts) - len(kept)
+        return kept
+
+
+class ParsePool:
+    """
+    Hands post files to worker processes and returns their results in order
+
+    At most two tasks per worker are in flight, which bounds the memory
+    held by normalised posts the writer has not reached yet.
+    """
+
+    def __init__(self, source, workers=None, window=None, split_bytes=SPLIT_BYTES,
+                 range_bytes=RANGE_BYTES):
+        self.source = source
+        self.window = window  # DateWindow passed to normalize_post
+        self.workers = workers or os.cpu_count() or 1
+        self.split_bytes = split_bytes
+        self.range_bytes = range_bytes
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def _tasks(self, paths, offsets):
+        for path in paths:
+            start = offsets.get(path, 0)
+            if self.source.size(path) <= self.split_bytes:
+                yield path, self._executor.submit(_parse_file, self.source.spec, path, start, self.window)
+                continue
+
+            try:
+                ranges = split_records(self.source.open_binary(path), self.range_bytes)
+            except Exception as e:
+                yield path, _failed(e)
+                continue
+            if ranges is None:
+                # A single record: nothing to split
+                yield path, self._executor.submit(_parse_file, self.source.spec, path, start, self.window)
+                continue
+
+            logger.info("Splitting %s into ranges of about %d bytes", path, self.range_bytes)
+            split = _SplitFile(start)
+            try:
+                for data in ranges:
+                    yield path, _RangeResult(self._executor.submit(_parse_range, data, self.window), split)
+            except Exception as e:
+                yield path, _failed(e)
+
+    def results(self, paths, offsets=None):
+        """
+        Yield (path, future) for every task in file and record order
+
+        offsets maps a path to the number of leading records to skip, for
+        resuming a partly imported file.
+
+        Each future resolves to a list of normalize_post results, with
+        {'error': message} for records that failed. A file that cannot be
+        read or decoded yields a future raising that error. The futures of
+        a split file only have result(), and must be resolved in order.
+        """
+        pending = deque()
+        for task in self._tasks(paths, offsets or {}):
+            pending.append(task)
+            if len(pending) >= 2 * self.workers:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
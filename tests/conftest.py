@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures
+Tests that need PostgreSQL run against TIMELINE_TEST_DATABASE_URL (a
+scratch database: its tables are created and dropped) and are skipped
+when it is not set.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_DATABASE_URL = os.getenv('TIMELINE_TEST_DATABASE_URL')
+
+
+@pytest.fixture
+def pg_db():
+    """models.db bound to the scratch database, with fresh tables"""
+    if not TEST_DATABASE_URL:
+        pytest.skip('TIMELINE_TEST_DATABASE_URL is not set')
+
+    from flask import Flask
+    from models import db, enable_extensions
+
+    test_app = Flask(__name__)
+    test_app.config['SQLALCHEMY_DATABASE_URI'] = TEST_DATABASE_URL
+    test_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(test_app)
+
+    with test_app.app_context():
+        enable_extensions()
+        db.drop_all()
+        db.create_all()
+        try:
+            yield db
+        finally:
+            db.session.remove()
+            db.drop_all()
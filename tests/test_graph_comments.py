@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CommentFetcher against a local stand-in for the Graph API batch endpoint
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from graph_comments import COMMENT_ATTEMPTS, CommentFetcher
+
+
+class StandInGraph:
+    """
+    Answers batch POSTs like graph.facebook.com
+
+    pages[post_id] is the number of comment pages the post has (default 1);
+    unanswered[post_id] is how many times its items come back as null
+    before the real answer (-1 for always).
+    """
+
+    def __init__(self):
+        self.pages = {}
+        self.unanswered = {}
+        self.batch_sizes = []
+        self._lock = threading.Lock()
+
+    def answer(self, relative_url):
+        parts = urlsplit(relative_url)
+        post_id = parts.path.split('/')[1]
+        page = int(parse_qs(parts.query).get('after', ['0'])[0])
+
+        with self._lock:
+            remaining = self.unanswered.get(post_id, 0)
+            if remaining:
+                self.unanswered[post_id] = remaining - 1 if remaining > 0 else remaining
+                return None
+
+        body = {'data': [{'id': f'{post_id}_c{page}', 'message': f'page {page}',
+                          'created_time': '2023-05-01T12:00:00+0000', 'like_count': page}]}
+        if page + 1 < self.pages.get(post_id, 1):
+            body['paging'] = {'cursors': {'after': str(page + 1)}, 'next': 'https://next'}
+        return {'code': 200, 'body': json.dumps(body)}
+
+    def handler(self):
+        graph = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = parse_qs(self.rfile.read(length).decode('utf-8'))
+                batch = json.loads(form['batch'][0])
+                with graph._lock:
+                    graph.batch_sizes.append(len(batch))
+                answers = [graph.answer(item['relative_url']) for item in batch]
+                payload = json.dumps(answers).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def graph():
+    stand_in = StandInGraph()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), stand_in.handler())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    stand_in.root = f'http://127.0.0.1:{server.server_address[1]}'
+    try:
+        yield stand_in
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_hundred_posts_take_two_batch_calls(graph):
+    post_ids = [f'post{index}' for index in range(100)]
+    fetcher = CommentFetcher('token', graph.root)
+
+    comments = fetcher.fetch(post_ids)
+
+    assert fetcher.calls == 2
+    assert sorted(graph.batch_sizes) == [50, 50]
+    assert set(comments) == set(post_ids)
+    assert all(len(comments[post_id]) == 1 for post_id in post_ids)
+
+
+def test_follows_comment_cursors(graph):
+    graph.pages = {'busy': 3}
+    fetcher = CommentFetcher('token', graph.root)
+
+    comments = fetcher.fetch(['busy', 'quiet'])
+
+    assert [comment['id'] for comment in comments['busy']] == ['busy_c0', 'busy_c1', 'busy_c2']
+    assert [comment['id'] for comment in comments['quiet']] == ['quiet_c0']
+    assert fetcher.calls == 3
+    assert graph.batch_sizes == [2, 1, 1]
+
+
+def test_retries_unanswered_items_then_gives_up(graph):
+    graph.unanswered = {'flaky': COMMENT_ATTEMPTS - 1, 'dead': -1}
+    fetcher = CommentFetcher('token', graph.root)
+
+    comments = fetcher.fetch(['flaky', 'dead'])
+
+    assert [comment['id'] for comment in comments['flaky']] == ['flaky_c0']
+    assert comments['dead'] == []
+    assert fetcher.calls == COMMENT_ATTEMPTS
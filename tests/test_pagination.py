@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Keyset pagination of timeline pages
+"""
+
+
+def test_relevance_pages_cover_posts_sharing_one_rank(pg_db):
+    from app import paginate_timeline
+    from models import Post
+
+    # Identical messages give every post the same ts_rank_cd score
+    for index in range(7):
+        pg_db.session.add(Post(facebook_id=f'ranked_{index}', message='apple pie',
+                               created_time=f'2023-05-0{index + 1}T12:00:00+0000'))
+    pg_db.session.commit()
+
+    condition, rank = Post.fulltext_match('apple')
+    seen = []
+    cursor = None
+    while True:
+        posts, cursor = paginate_timeline(Post.query.filter(condition), Post, cursor,
+                                          page_size=3, rank=rank)
+        seen.extend(post.facebook_id for post in posts)
+        if cursor is None:
+            break
+
+    assert sorted(seen) == sorted(f'ranked_{index}' for index in range(7))
+
+
+def test_date_pages_reach_posts_without_created_time(pg_db):
+    from app import paginate_timeline
+    from models import Post
+
+    for index in range(5):
+        pg_db.session.add(Post(facebook_id=f'dated_{index}', message='dated',
+                               created_time=f'2023-05-0{index + 1}T12:00:00+0000'))
+    for index in range(4):
+        pg_db.session.add(Post(facebook_id=f'undated_{index}', message='undated', created_time=''))
+    pg_db.session.commit()
+
+    seen = []
+    cursor = None
+    while True:
+        posts, cursor = paginate_timeline(Post.query, Post, cursor, page_size=2)
+        seen.extend(post.facebook_id for post in posts)
+        if cursor is None:
+            break
+
+    # Newest first, undated posts after every dated one
+    assert seen[:5] == [f'dated_{index}' for index in reversed(range(5))]
+    assert sorted(seen[5:]) == [f'undated_{index}' for index in range(4)]
+
+
+def test_date_seek_is_an_index_condition(pg_db):
+    from sqlalchemy import event
+    from app import paginate_timeline, encode_cursor
+    from models import Post
+
+    for index in range(20):
+        pg_db.session.add(Post(facebook_id=f'post_{index}', message='post',
+                               created_time=f'2023-05-{index + 1:02d}T12:00:00+0000'))
+    pg_db.session.commit()
+    middle = Post.query.filter_by(facebook_id='post_10').one()
+    cursor = encode_cursor(middle.created_at, middle.id)
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    engine = pg_db.engine
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        posts, _ = paginate_timeline(Post.query, Post, cursor, page_size=3)
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+    assert [post.facebook_id for post in posts] == ['post_9', 'post_8', 'post_7']
+    seek = next(statement for statement in statements if 'LIMIT' in statement[0])
+
+    with engine.connect() as conn:
+        raw = conn.connection.cursor()
+        # The table is tiny; make the planner show how it would use the index
+        raw.execute('SET enable_seqscan = off')
+        raw.execute('EXPLAIN ' + seek[0], seek[1])
+        plan = '\n'.join(row[0] for row in raw.fetchall())
+
+    assert 'ix_post_created_at_id' in plan
+    assert 'Index Cond: (ROW(created_at, id) < ROW(' in plan
+    assert 'Sort' not in plan
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ParsePool splitting of large post files into byte ranges
+"""
+
+import json
+
+import pytest
+
+from export_source import DirectorySource
+from parse_pool import ParsePool
+
+
+def _records(count):
+    return [{'timestamp': 1500000000 + index,
+             'data': [{'post': f'post {index} with "quotes", [brackets] and {{braces}}\\'}],
+             'attachments': [{'data': [{'media': {'uri': f'photos/{index}.jpg'}}]}]}
+            for index in range(count)]
+
+
+def _parse(root, split_bytes, offsets=None):
+    with DirectorySource(str(root)) as source, ParsePool(source, workers=2, split_bytes=split_bytes,
+                                                         range_bytes=2048) as pool:
+        posts = []
+        futures = 0
+        for _, future in pool.results(['posts.json'], offsets):
+            futures += 1
+            posts.extend(future.result())
+    return posts, futures
+
+
+@pytest.mark.parametrize('layout', ['list', 'keyed'])
+def test_split_file_matches_whole_file(tmp_path, layout):
+    records = _records(300)
+    document = records if layout == 'list' else {
+        'status_updates': records, 'other': [{'timestamp': 1}, {'timestamp': 2}]}
+    (tmp_path / 'posts.json').write_text(json.dumps(document, indent=2), encoding='utf-8')
+
+    whole, whole_futures = _parse(tmp_path, split_bytes=10 ** 9)
+    split, split_futures = _parse(tmp_path, split_bytes=0)
+
+    assert whole_futures == 1
+    assert split_futures > 10
+    assert split == whole
+    assert len(split) == 300
+
+
+def test_split_file_resumes_from_offset(tmp_path):
+    (tmp_path / 'posts.json').write_text(json.dumps(_records(300), indent=2), encoding='utf-8')
+
+    whole, _ = _parse(tmp_path, split_bytes=10 ** 9)
+    resumed, _ = _parse(tmp_path, split_bytes=0, offsets={'posts.json': 123})
+
+    assert resumed == whole[123:]
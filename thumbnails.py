@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Video thumbnail generation with ffmpeg, run on a bounded worker pool
+"""
+
+import logging
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def thumbnail_path_for(video_path):
+    """Thumbnail file that sits next to the video"""
+    return video_path.rsplit('.', 1)[0] + '_thumb.jpg'
+
+
+def generate_thumbnail(video_path):
+    """
+    Generate a 320px-wide thumbnail from the video at 1 second
+
+    Skips ffmpeg when an existing thumbnail is at least as new as the video.
+
+    Returns:
+        web path of the thumbnail, or None if generation failed
+    """
+    thumbnail_path = thumbnail_path_for(video_path)
+
+    try:
+        if (os.path.exists(thumbnail_path) and
+                os.path.getmtime(thumbnail_path) >= os.path.getmtime(video_path)):
+            return thumbnail_path.replace('uploads/', '/uploads/')
+
+        cmd = [
+            'ffmpeg',
+            '-i', video_path,
+            '-ss', '00:00:01',
+            '-vframes', '1',
+            '-vf', 'scale=320:-1',  # Resize to 320px wide
+            '-q:v', '2',
+            thumbnail_path,
+            '-y'
+        ]
+        subprocess.run(cmd, capture_output=True, text=True)
+
+        if os.path.exists(thumbnail_path):
+            # Return web path
+            return thumbnail_path.replace('uploads/', '/uploads/')
+
+        logger.warning("Thumbnail generation failed: %s", video_path)
+        return None
+
+    except Exception as e:
+        logger.warning("Error generating thumbnail: %s", e)
+        return None
+
+
+class ThumbnailPool:
+    """
+    Runs generate_thumbnail for many videos concurrently
+
+    The work happens inside ffmpeg child processes, so threads are enough to
+    keep every core busy. Each video is submitted once; result() blocks
+    only until that video's thumbnail is ready.
+    """
+
+    def __init__(self, workers=None, progress_every=25):
+        self.workers = workers or os.cpu_count() or 1
+        self.progress_every = progress_every
+        self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                            thread_name_prefix='thumbnail')
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+
+    def _on_done(self, future):
+        with self._lock:
+            self.completed += 1
+            completed, submitted = self.completed, self.submitted
+        if completed % self.progress_every == 0 or completed == submitted:
+            logger.info("Thumbnails: %d/%d done", completed, submitted)
+
+    def submit(self, video_path):
+        """Queue a thumbnail job for video_path (once) and return its future"""
+        with self._lock:
+            future = self._futures.get(video_path)
+            if future is not None:
+                return future
+            future = self._executor.submit(generate_thumbnail, video_path)
+            self._futures[video_path] = future
+            self.submitted += 1
+
+        # Outside the lock: the callback runs immediately if the job already finished
+        future.add_done_callback(self._on_done)
+        return future
+
+    def result(self, video_path):
+        """Web path of video_path's thumbnail, waiting for it if needed"""
+        return self.submit(video_path).result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-process LRU cache of rendered timeline pages
+Entries are stored with the table's cache version (see CacheVersionMixin)
+and ignored once the version moves, so writes from imports and API syncs
+in any process invalidate them.
+"""
+
+import threading
+from collections import OrderedDict
+
+# Query parameters that trigger side effects rather than select posts
+IGNORED_PARAMS = ('fetch_api', 'fetch_comments')
+
+
+def cache_key(endpoint, args, user_data=None):
+    """
+    Normalised key for a timeline request: parameter order and empty
+    values do not matter
+    """
+    params = tuple(sorted(
+        (key, value)
+        for key, values in args.lists()
+        if key not in IGNORED_PARAMS
+        for value in values
+        if value != ''
+    ))
+    user = (user_data or {}).get('id'), (user_data or {}).get('name')
+    return endpoint, params, user
+
+
+class TimelineCache:
+    """Size-bounded LRU of rendered pages, each tagged with a cache version"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """Cached value for key at this version, or None"""
+        if not self.max_entries:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, value):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()